@@ -0,0 +1,95 @@
+"""
+ChatPDF maintenance commands
+
+Usage:
+    python -m app.cli migrate-vectors [--source chroma] [--target numpy]
+    python -m app.cli reindex --dimensions 256 [--source-dimensions 768]
+"""
+import argparse
+import time
+
+from .config import settings
+
+
+def migrate_vectors(args):
+    """Copy every chunk (text, embedding, metadata) from one backend into another."""
+    from .services.vector_store import create_vector_store
+
+    if args.source == args.target:
+        raise SystemExit("Source and target backends must differ")
+
+    source = create_vector_store(args.source, model=settings.embedding_model)
+    target = create_vector_store(args.target, model=settings.embedding_model)
+    total = source.get_collection_stats()["count"]
+    print(f"🚚 Migrating {total} chunks: {args.source} → {args.target}")
+
+    copied = 0
+    started = time.monotonic()
+    for batch in source.iter_chunks(batch_size=args.batch_size):
+        target.upsert_chunks(batch["ids"], batch["documents"], batch["embeddings"], batch["metadatas"])
+        copied += len(batch["ids"])
+        print(f"   {copied}/{total} chunks copied")
+
+    elapsed = time.monotonic() - started
+    print(f"✅ Migration complete: {copied} chunks in {elapsed:.1f}s")
+    print(f"   Set VECTOR_BACKEND={args.target} to serve queries from the new store")
+
+
+def reindex(args):
+    """
+    Convert a collection to a smaller embedding size without calling the API.
+    Gemini embeddings are Matryoshka-trained, so the first N components of a
+    stored vector, re-normalized, are a valid N-dimensional embedding.
+    The live collection keeps serving queries until EMBEDDING_DIMENSIONS is switched.
+    """
+    import numpy as np
+    from .services.vector_store import create_vector_store
+
+    source_dims = args.source_dimensions or settings.embedding_dimensions
+    target_dims = args.dimensions
+    if target_dims >= source_dims:
+        raise SystemExit(f"Target dimensions must be smaller than the source ({source_dims}d); larger sizes need re-embedding")
+
+    source = create_vector_store(args.backend, dimensions=source_dims, model=settings.embedding_model)
+    target = create_vector_store(args.backend, dimensions=target_dims, model=settings.embedding_model)
+    total = source.get_collection_stats()["count"]
+    print(f"📐 Reindexing {total} chunks: {source_dims}d → {target_dims}d ({args.backend or settings.vector_backend})")
+
+    converted = 0
+    started = time.monotonic()
+    for batch in source.iter_chunks(batch_size=args.batch_size):
+        vectors = np.asarray(batch["embeddings"], dtype=np.float32)[:, :target_dims]
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        norms[norms == 0] = 1.0
+        target.upsert_chunks(batch["ids"], batch["documents"], (vectors / norms).tolist(), batch["metadatas"])
+        converted += len(batch["ids"])
+        print(f"   {converted}/{total} chunks converted")
+
+    elapsed = time.monotonic() - started
+    print(f"✅ Reindex complete: {converted} chunks in {elapsed:.1f}s")
+    print(f"   Set EMBEDDING_DIMENSIONS={target_dims} and restart; the server switches to the new collection")
+
+
+def main():
+    parser = argparse.ArgumentParser(prog="python -m app.cli", description="ChatPDF maintenance commands")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    migrate = commands.add_parser("migrate-vectors", help="Copy all chunks between vector store backends")
+    migrate.add_argument("--source", default="chroma", choices=["chroma", "numpy"])
+    migrate.add_argument("--target", default="numpy", choices=["chroma", "numpy"])
+    migrate.add_argument("--batch-size", type=int, default=500)
+    migrate.set_defaults(func=migrate_vectors)
+
+    reindex_cmd = commands.add_parser("reindex", help="Convert stored vectors to a smaller embedding size")
+    reindex_cmd.add_argument("--dimensions", type=int, required=True, help="Target output dimensionality, e.g. 256 or 512")
+    reindex_cmd.add_argument("--source-dimensions", type=int, default=None, help="Defaults to EMBEDDING_DIMENSIONS")
+    reindex_cmd.add_argument("--backend", default=None, choices=["chroma", "numpy"], help="Defaults to VECTOR_BACKEND")
+    reindex_cmd.add_argument("--batch-size", type=int, default=500)
+    reindex_cmd.set_defaults(func=reindex)
+
+    args = parser.parse_args()
+    args.func(args)
+
+
+if __name__ == "__main__":
+    main()
@@ -13,16 +13,73 @@ class Settings(BaseSettings):
     # Database
     database_url: str = "sqlite:///./chatpdf.db"
     
-    # Vector Store (ChromaDB)
+    # Vector Store
+    vector_backend: str = "chroma"  # "chroma" or "numpy" (in-process memory-mapped index)
     chroma_persist_dir: str = "./chroma_db"
+    vector_index_dir: str = "./vector_index"  # Used by the numpy backend
+    vector_quantization: str = "none"  # numpy backend: "none", "int8" or "float16" in-memory codes
+    vector_rescore_factor: int = 4  # Quantized search re-scores top k * factor candidates exactly
+    retrieval_mode: str = "hybrid"  # "vector", "hybrid" (vector + BM25 fused by rank) or "lexical" (no embedding call)
+    retrieval_candidates: int = 20  # Per-retriever candidates fused in hybrid mode
+    retrieval_top_k: int = 8  # Chunks retrieved per question before context packing
+    neighbor_window: int = 1  # Adjacent chunks fetched on each side of a hit (small-to-big; 0 = off)
+    context_token_budget: int = 2000  # Estimated tokens of retrieved context sent to the LLM
+    context_min_similarity: float = 0.3  # Drop chunks below this cosine similarity
+    context_dedup_threshold: float = 0.8  # Shingle overlap at which chunks count as near-duplicates
+    lexical_index_path: str = "./lexical_index/chunks.sqlite3"  # BM25 (SQLite FTS5) index over chunk text
+    exact_search_max_chunks: int = 20000  # Filtered queries over at most this many chunks skip the ANN index
+    partition_cache_mb: int = 64  # Memory budget for per-document vector partitions
     
     # Gemini LLM
     gemini_api_key: str = ""
     gemini_model: str = "gemini-2.0-flash"
     
+    # Embeddings
+    embedding_model: str = "models/text-embedding-004"  # Changing this rebuilds the index in the background
+    embedding_dimensions: int = 768  # Output size (e.g. 256/512); smaller = less memory, faster search
+    embedding_batch_size: int = 100  # Max texts per embed_content call
+    embedding_max_in_flight: int = 4  # Upper bound on concurrent embedding calls
+    embedding_batch_linger_ms: int = 20  # Wait this long to fill a partial batch
+    embedding_async_concurrency: int = 16  # Concurrent async (query-path) embedding calls
+    query_embed_window_ms: int = 10  # Coalesce concurrent query embeddings (0 = off)
+    query_embed_max_batch: int = 32  # Flush the window early at this many questions
+    
+    # Chat Streaming (SSE)
+    stream_flush_interval_ms: int = 30  # Coalesce answer tokens into one frame for up to this long (0 = frame per token)
+    stream_flush_max_chars: int = 256  # Send the coalesced frame early at this many characters
+    stream_keepalive_seconds: float = 15  # Comment frame after this long without output (0 = off)
+
+    # Re-embedding (background rebuild after an embedding model/size change)
+    reembed_batch_size: int = 100  # Chunks re-embedded per step
+    reembed_max_chunks_per_sec: float = 50  # Throttle so the rebuild leaves quota for live traffic (0 = unlimited)
+    reembed_drop_old: bool = True  # Delete the previous collection once the new one is live
+    
+    # Query Cache (question embedding + retrieval results)
+    query_cache_size: int = 512  # 0 disables the cache
+    query_cache_ttl_seconds: int = 600
+    embedding_cache_enabled: bool = True
+    embedding_cache_path: str = "./embedding_cache/embeddings.sqlite3"
+    embedding_cache_max_mb: int = 256  # LRU eviction beyond this size
+    
     # File Storage
     upload_directory: str = "./uploads"
     max_file_size: int = 10_000_000  # 10MB
+    upload_chunk_size: int = 1024 * 1024  # 1MB read buffer when streaming uploads
+    
+    # Document Extraction
+    chunk_size: int = 500  # Characters per embedded chunk; neighbor expansion restores context
+    chunk_overlap: int = 50
+    section_max_chars: int = 4000  # DOCX/HTML/Markdown/text sections are grouped up to this size
+    pdf_engine: str = "auto"  # "auto" (fastest installed), "pymupdf", "pypdf" or "pypdf2"
+    html_parser: str = "auto"  # "auto", "lxml" or "html.parser"
+    extraction_timeout_seconds: int = 120  # Per-document wall-clock limit (0 = none)
+    extraction_memory_mb: int = 384  # Address-space budget shared by the extraction process and its PDF pool (0 = none)
+    pdf_extract_workers: int = 0  # Process pool size for PDF extraction (0 = CPU count)
+    pdf_parallel_min_pages: int = 64  # PDFs with fewer pages are extracted in-process
+    
+    # Ingestion Queue
+    ingestion_workers: int = 2  # Documents processed concurrently
+    ingestion_max_attempts: int = 3  # Give up on jobs interrupted this many times
     
     # Security
     secret_key: str = "dev-secret-key-change-in-production"
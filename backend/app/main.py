@@ -7,7 +7,7 @@ from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 from contextlib import asynccontextmanager
 
-from .database import engine, Base
+from .database import engine, Base, add_missing_columns
 from .routes import upload, documents, chat, conversations
 from .config import settings
 
@@ -24,23 +24,35 @@ async def lifespan(app: FastAPI):
     
     # Create database tables
     Base.metadata.create_all(bind=engine)
+    add_missing_columns()
     print("✅ Database tables created")
     
+    # Start ingestion workers (resumes jobs interrupted by a restart)
+    from .services.ingestion import ingestion_queue
+    ingestion_queue.start()
+    
     # Check Gemini API key
     if settings.gemini_api_key:
         print(f"✅ Gemini API key configured (model: {settings.gemini_model})")
     else:
         print("⚠️  GEMINI_API_KEY not set in environment")
     
-    # Check ChromaDB
+    # Check vector store
     from .services.vector_store import vector_store
     stats = vector_store.get_collection_stats()
-    print(f"✅ ChromaDB ready ({stats['count']} chunks in collection)")
+    print(f"✅ Vector store ready ({stats['backend']}, {stats['count']} chunks in collection {stats['name']})")
+    # Re-embed into a new collection if the embedding model/size changed
+    vector_store.start_rebuild_if_needed()
+    vector_store.start_lexical_backfill_if_needed()
     
     yield
     
     # Shutdown
     print("👋 Shutting down...")
+    ingestion_queue.stop()
+    vector_store.stop()
+    from .services.document_processor import stop_isolation_worker
+    stop_isolation_worker()
 
 
 app = FastAPI(
@@ -97,14 +109,16 @@ async def health_check():
     # Check Gemini API key
     gemini_status = "healthy" if settings.gemini_api_key else "missing_api_key"
     
-    # Check ChromaDB
+    # Check vector store
     try:
         stats = vector_store.get_collection_stats()
-        chroma_status = "healthy"
-        chroma_count = stats["count"]
+        vector_status = "healthy"
+        vector_count = stats["count"]
+        vector_path = stats["path"]
     except Exception as e:
-        chroma_status = f"error: {str(e)}"
-        chroma_count = 0
+        vector_status = f"error: {str(e)}"
+        vector_count = 0
+        vector_path = None
     
     # Check uploads directory
     uploads_dir = settings.upload_directory
@@ -112,7 +126,7 @@ async def health_check():
     
     overall = "healthy" if all([
         gemini_status == "healthy",
-        chroma_status == "healthy",
+        vector_status == "healthy",
         uploads_status == "healthy"
     ]) else "degraded"
     
@@ -124,10 +138,11 @@ async def health_check():
                 "status": gemini_status,
                 "model": settings.gemini_model
             },
-            "chromadb": {
-                "status": chroma_status,
-                "path": settings.chroma_persist_dir,
-                "chunks": chroma_count
+            "vector_store": {
+                "status": vector_status,
+                "backend": settings.vector_backend,
+                "path": vector_path,
+                "chunks": vector_count
             },
             "storage": {
                 "status": uploads_status,
@@ -146,7 +161,30 @@ async def debug_vectors():
         return {
             "collection": stats["name"],
             "chunks": stats["count"],
-            "persist_dir": settings.chroma_persist_dir
+            "backend": stats["backend"],
+            "persist_dir": stats["path"],
+            "embedding_model": stats["embedding_model"],
+            "dimensions": stats["dimensions"],
+            "rebuild": stats["rebuild"],
+            "lexical_chunks": stats["lexical_chunks"],
+            "retrieval_mode": settings.retrieval_mode
         }
     except Exception as e:
         return {"error": str(e)}
+
+
+@app.get("/api/debug/streams")
+async def debug_streams():
+    """Per-stream SSE counters: frames, bytes, tokens per frame, flush latency."""
+    from .services.sse import stream_registry
+    return stream_registry.stats()
+
+
+@app.get("/api/debug/embeddings")
+async def debug_embeddings():
+    """Embedding batcher counters: batches, items/sec, throttle events."""
+    from .services.embeddings import embedding_service
+    from .services.query_cache import query_cache
+    stats = embedding_service.get_stats()
+    stats["query_cache"] = query_cache.stats()
+    return stats
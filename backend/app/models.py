@@ -21,12 +21,26 @@ class Document(Base):
     original_filename = Column(String, nullable=False)
     file_path = Column(String, nullable=False)
     file_size = Column(Integer, nullable=False)
+    content_hash = Column(String, nullable=True, index=True)  # SHA-256 of file bytes
     page_count = Column(Integer, nullable=False)
     chunk_count = Column(Integer, nullable=True)
     upload_date = Column(DateTime, default=datetime.utcnow)
     processed = Column(Boolean, default=False)
     processing_error = Column(Text, nullable=True)
 
+class IngestionJob(Base):
+    __tablename__ = "ingestion_jobs"
+
+    id = Column(String, primary_key=True, default=lambda: str(uuid.uuid4()))
+    document_id = Column(String, ForeignKey("documents.id", ondelete="CASCADE"), nullable=False, index=True)
+    state = Column(String, nullable=False, default="queued")  # queued/extracting/embedding/indexing/done/failed
+    attempts = Column(Integer, nullable=False, default=0)
+    error = Column(Text, nullable=True)
+    created_at = Column(DateTime, default=datetime.utcnow)
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    started_at = Column(DateTime, nullable=True)
+    finished_at = Column(DateTime, nullable=True)
+
 class Conversation(Base):
     __tablename__ = "conversations"
 
@@ -43,4 +57,5 @@ class Message(Base):
     role = Column(String, nullable=False)  # 'user' or 'assistant'
     content = Column(Text, nullable=False)
     citations = Column(JSON, nullable=True)
+    truncated = Column(Boolean, nullable=True, default=False)  # Answer cut short by a client disconnect
     created_at = Column(DateTime, default=datetime.utcnow)
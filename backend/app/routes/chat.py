@@ -1,87 +1,179 @@
-from fastapi import APIRouter, HTTPException, Depends
+from fastapi import APIRouter, HTTPException
 from fastapi.responses import StreamingResponse
-from sqlalchemy.orm import Session
-from ..database import get_db
+from typing import Optional
+from datetime import datetime
+from ..database import SessionLocal
 from .. import models, schemas
 from ..services.chat_service import chat_service
-import json
+from ..services.stage_timings import StageTimings
+from ..services.sse import sse_frames, stream_registry
 import asyncio
 import uuid
 
 router = APIRouter(tags=["chat"])
 
-@router.post("/chat")
-async def chat(request: schemas.ChatRequest, db: Session = Depends(get_db)):
-    # 1. Handle Conversation
-    conv_id = request.conversation_id
-    if not conv_id:
-        conv_id = str(uuid.uuid4())
-        # Auto-generate title using AI
-        title = chat_service.generate_title(request.question)
-        db_conv = models.Conversation(id=conv_id, title=title)
-        db.add(db_conv)
+# Strong references to in-flight title tasks (the event loop only keeps weak ones)
+_title_tasks = set()
+
+
+def _start_conversation(conv_id: str, question: str, placeholder: Optional[str]):
+    """
+    Create the conversation (when `placeholder` title is given) or check that
+    it exists, and save the user message, in one transaction on a fresh
+    session. Runs in a worker thread.
+    """
+    db = SessionLocal()
+    try:
+        if placeholder:
+            db.add(models.Conversation(id=conv_id, title=placeholder))
+        elif not db.query(models.Conversation.id).filter(models.Conversation.id == conv_id).first():
+            raise HTTPException(status_code=404, detail="Conversation not found")
+        db.add(models.Message(
+            id=str(uuid.uuid4()),
+            conversation_id=conv_id,
+            role="user",
+            content=question
+        ))
         db.commit()
+    finally:
+        db.close()
 
-    else:
+
+def _save_title(conv_id: str, placeholder: str, title: str):
+    """Persist a generated title unless the conversation was renamed meanwhile."""
+    db = SessionLocal()
+    try:
         db_conv = db.query(models.Conversation).filter(models.Conversation.id == conv_id).first()
-        if not db_conv:
-            raise HTTPException(status_code=404, detail="Conversation not found")
+        if db_conv and db_conv.title == placeholder:
+            db_conv.title = title
+            db.commit()
+    finally:
+        db.close()
+
+
+def _save_answer(conv_id: str, content: str, citations: list, truncated: bool = False):
+    """Save the assistant message and bump the conversation timestamp."""
+    db = SessionLocal()
+    try:
+        db.add(models.Message(
+            id=str(uuid.uuid4()),
+            conversation_id=conv_id,
+            role="assistant",
+            content=content,
+            citations=citations,
+            truncated=truncated
+        ))
+        db_conv = db.query(models.Conversation).filter(models.Conversation.id == conv_id).first()
+        if db_conv:
+            db_conv.updated_at = datetime.utcnow()
+        db.commit()
+    finally:
+        db.close()
+
+
+async def _title_job(conv_id: str, question: str, placeholder: str) -> str:
+    title = await chat_service.generate_title(question)
+    if title != placeholder:
+        try:
+            await asyncio.to_thread(_save_title, conv_id, placeholder, title)
+        except Exception as e:
+            print(f"Error saving title: {e}")
+    return title
 
-    # 2. Save User Message
-    user_msg = models.Message(
-        id=str(uuid.uuid4()),
-        conversation_id=conv_id,
-        role="user",
-        content=request.question
+
+@router.post("/chat")
+async def chat(request: schemas.ChatRequest):
+    timings = StageTimings()
+
+    # 1. Start retrieval first: embedding and search don't depend on the
+    #    conversation, so they overlap with the DB work below
+    retrieval = asyncio.create_task(
+        chat_service.retrieve(request.question, request.document_ids, timings)
     )
-    db.add(user_msg)
-    db.commit()
+
+    # 2. Handle Conversation and save the user message (off the event loop)
+    conv_id = request.conversation_id or str(uuid.uuid4())
+    # New conversations get a title taken from the question right away;
+    # the AI title is generated concurrently with the answer
+    placeholder = None if request.conversation_id else chat_service.placeholder_title(request.question)
+    try:
+        with timings.stage("db"):
+            await asyncio.to_thread(_start_conversation, conv_id, request.question, placeholder)
+    except BaseException:
+        retrieval.cancel()
+        raise
+
+    title_task = None
+    if placeholder:
+        title_task = asyncio.create_task(_title_job(conv_id, request.question, placeholder))
+        _title_tasks.add(title_task)
+        title_task.add_done_callback(_title_tasks.discard)
 
     async def event_stream():
         full_content = ""
         citations = []
+        parts = []
+        saved = False
+        title_sent = title_task is None
+
         try:
             # Yield start event
-            yield f"data: {json.dumps({'type': 'start', 'conversation_id': conv_id})}\n\n"
+            yield {"type": "start", "conversation_id": conv_id}
 
             async for part in chat_service.generate_answer(
                 question=request.question,
-                doc_ids=request.document_ids
+                doc_ids=request.document_ids,
+                retrieval=retrieval,
+                timings=timings
             ):
-                if part["type"] == "done":
+                if part["type"] == "chunk":
+                    parts.append(part["content"])
+                elif part["type"] == "citation":
+                    citations.append(part["data"])
+                elif part["type"] == "done":
                     full_content = part.get("full_content", "")
                     citations = part.get("citations", [])
                 
-                yield f"data: {json.dumps(part)}\n\n"
-                # await asyncio.sleep(0.01) # No longer needed with real async stream
+                yield part
+
+                # Push the title as soon as it is ready, between answer events
+                if not title_sent and title_task.done():
+                    title_sent = True
+                    yield {"type": "title", "conversation_id": conv_id, "title": title_task.result()}
 
-            # 3. Save Assistant Message
+            # 3. Save Assistant Message (fresh session, off the event loop)
             if full_content:
-                assistant_msg = models.Message(
-                    id=str(uuid.uuid4()),
-                    conversation_id=conv_id,
-                    role="assistant",
-                    content=full_content,
-                    citations=citations
-                )
-                # We need a new session or be careful with the current one in async generator
-                # Usually best to use a fresh session for the background save if needed,
-                # but here we can just use the provided db if it stays alive.
-                # Since StreamingResponse keeps the request alive, it should be fine.
-                db.add(assistant_msg)
-                
-                # Update conversation timestamp
-                db_conv = db.query(models.Conversation).filter(models.Conversation.id == conv_id).first()
-                if db_conv:
-                    from datetime import datetime
-                    db_conv.updated_at = datetime.utcnow()
-                
-                db.commit()
+                saved = True
+                await asyncio.to_thread(_save_answer, conv_id, full_content, citations)
+
+            # The stream ends here even if the title is still pending: it is
+            # persisted when ready and the client reloads the conversation list
+
+        except asyncio.CancelledError:
+            # Client went away: Gemini and any pending embedding/retrieval
+            # were cancelled with us; keep the partial answer, marked truncated
+            if not saved and parts:
+                print(f"✂️  Chat stream cancelled by client disconnect ({conv_id})")
+                await asyncio.to_thread(_save_answer, conv_id, "".join(parts), citations, True)
+            raise
 
         except Exception as e:
-            yield f"data: {json.dumps({'type': 'error', 'content': str(e)})}\n\n"
+            yield {"type": "error", "content": str(e)}
+
+    async def framed_stream():
+        # Tokens are coalesced into fewer, larger SSE frames (see services/sse.py)
+        # A client disconnect cancels this generator (Starlette listens for
+        # it); sse_frames then cancels the answer and waits for the partial save
+        stats = stream_registry.open(f"{conv_id}:{uuid.uuid4().hex[:8]}")
+        try:
+            async for frame in sse_frames(event_stream(), stats):
+                yield frame
+        finally:
+            if not retrieval.done():
+                retrieval.cancel()
+            stream_registry.close(stats)
 
     return StreamingResponse(
-        event_stream(),
+        framed_stream(),
         media_type="text/event-stream"
     )
@@ -1,6 +1,7 @@
 from fastapi import APIRouter, Depends, HTTPException
 from sqlalchemy.orm import Session
 from typing import List
+import asyncio
 import os
 from ..database import get_db
 from .. import models, schemas
@@ -23,11 +24,21 @@ async def get_document(document_id: str, db: Session = Depends(get_db)):
         raise HTTPException(status_code=404, detail="Document not found")
     return db_doc
 
+@router.get("/documents/{document_id}/job", response_model=schemas.IngestionJob)
+async def get_document_job(document_id: str, db: Session = Depends(get_db)):
+    """Latest ingestion job for a document (state, attempts, error)."""
+    job = db.query(models.IngestionJob).filter(
+        models.IngestionJob.document_id == document_id
+    ).order_by(models.IngestionJob.created_at.desc()).first()
+    if job is None:
+        raise HTTPException(status_code=404, detail="No ingestion job for this document")
+    return job
+
 @router.delete("/documents/{document_id}")
 async def delete_document(document_id: str, db: Session = Depends(get_db)):
     """
     Delete a document and all associated resources:
-    - Physical file from disk
+    - Physical file from disk (kept if another duplicate upload shares it)
     - Vector embeddings from ChromaDB
     - Database record
     """
@@ -42,8 +53,14 @@ async def delete_document(document_id: str, db: Session = Depends(get_db)):
         "errors": []
     }
     
-    # 1. Delete file from filesystem
-    if db_doc.file_path:
+    # 1. Delete file from filesystem (unless a duplicate upload still shares it)
+    shared = db.query(models.Document).filter(
+        models.Document.file_path == db_doc.file_path,
+        models.Document.id != document_id
+    ).first()
+    if shared:
+        print(f"ℹ️  File still used by document {shared.id}, keeping: {db_doc.file_path}")
+    elif db_doc.file_path:
         try:
             if os.path.exists(db_doc.file_path):
                 os.remove(db_doc.file_path)
@@ -60,7 +77,8 @@ async def delete_document(document_id: str, db: Session = Depends(get_db)):
     # 2. Delete vectors from vector store
     from ..services.vector_store import vector_store
     try:
-        vector_store.delete_document(document_id)
+        # The store may wait on its write lock; keep the event loop free
+        await asyncio.to_thread(vector_store.delete_document, document_id)
         deletion_status["vectors_deleted"] = True
         print(f"✅ Deleted vectors for document: {document_id}")
     except Exception as e:
@@ -70,6 +88,9 @@ async def delete_document(document_id: str, db: Session = Depends(get_db)):
 
     # 3. Delete from database
     try:
+        db.query(models.IngestionJob).filter(
+            models.IngestionJob.document_id == document_id
+        ).delete(synchronize_session=False)
         db.delete(db_doc)
         db.commit()
         deletion_status["db_deleted"] = True
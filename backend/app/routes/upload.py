@@ -1,10 +1,12 @@
-from fastapi import APIRouter, UploadFile, File, Depends, HTTPException, BackgroundTasks
+from fastapi import APIRouter, UploadFile, File, Depends, HTTPException
 from sqlalchemy.orm import Session
 from ..database import get_db
 from .. import models, schemas
 from ..services.document_processor import DocumentProcessor
-from ..services.embeddings import embedding_service
 from ..services.vector_store import vector_store
+from ..services.file_storage import save_upload_file, FileTooLargeError
+from ..services.ingestion import ingestion_queue
+import asyncio
 import uuid
 import os
 from pathlib import Path
@@ -16,55 +18,38 @@ UPLOAD_DIR.mkdir(exist_ok=True)
 
 MAX_FILE_SIZE = 10 * 1024 * 1024  # 10MB
 
-async def process_document_background(doc_id: str, filename: str, file_path: str, db: Session):
-    """Background task to process any document type."""
-    try:
-        # 1. Extract text and pages/sections
-        doc_data = DocumentProcessor.extract_pages(file_path)
-        
-        all_chunks = []
-        all_embeddings = []
-        all_metadatas = []
-        
-        # 2. Process each page/section
-        for page in doc_data:
-            chunks = DocumentProcessor.chunk_text(page["content"])
-            if not chunks:
-                continue
-                
-            embeddings = embedding_service.embed_chunks(chunks)
-            
-            for i, chunk in enumerate(chunks):
-                all_chunks.append(chunk)
-                all_embeddings.append(embeddings[i])
-                all_metadatas.append({
-                    "document_id": doc_id,
-                    "filename": filename,
-                    "page": page["page_number"],
-                    "chunk_index": i
-                })
-        
-        # 3. Store in Vector DB
-        if all_chunks:
-            vector_store.add_chunks(doc_id, all_chunks, all_embeddings, all_metadatas)
-        
-        # 4. Update Database
-        doc = db.query(models.Document).filter(models.Document.id == doc_id).first()
-        if doc:
-            doc.processed = True
-            doc.chunk_count = len(all_chunks)
-            db.commit()
-            
-    except Exception as e:
-        print(f"Error processing document {doc_id}: {str(e)}")
-        doc = db.query(models.Document).filter(models.Document.id == doc_id).first()
-        if doc:
-            doc.processing_error = str(e)
-            db.commit()
+async def register_duplicate(db: Session, source_doc: models.Document, doc_id: str, filename: str) -> dict:
+    """
+    Create a new document record for content we have already processed.
+    The stored file is shared and the chunk vectors are cloned, so no
+    extraction or embedding work is repeated.
+    """
+    # The store may wait on its write lock; keep the event loop free
+    chunk_count = await asyncio.to_thread(vector_store.clone_document, source_doc.id, doc_id, filename)
+
+    db_doc = models.Document(
+        id=doc_id,
+        filename=source_doc.filename,
+        original_filename=filename,
+        file_path=source_doc.file_path,
+        file_size=source_doc.file_size,
+        content_hash=source_doc.content_hash,
+        page_count=source_doc.page_count,
+        chunk_count=chunk_count,
+        processed=True
+    )
+    db.add(db_doc)
+    db.commit()
+
+    return {
+        "document_id": doc_id,
+        "filename": filename,
+        "status": "processed",
+        "message": "Duplicate of an existing document; reused its processed content"
+    }
 
 @router.post("/upload", response_model=schemas.UploadResponse, status_code=202)
 async def upload_document(
-    background_tasks: BackgroundTasks,
     file: UploadFile = File(...),
     db: Session = Depends(get_db)
 ):
@@ -76,48 +61,53 @@ async def upload_document(
             detail=f"Unsupported file type. Supported formats: {supported}"
         )
 
-    # 2. Validate file size (FastAPI doesn't do this automatically for SpoofFile)
-    # We can check content length if provided, or read a bit
-    # For now, let's just save and check size
-    
+    # 2. Stream file to disk (size limit enforced while bytes arrive)
     file_id = str(uuid.uuid4())
     file_ext = Path(file.filename).suffix
     saved_filename = f"{file_id}{file_ext}"
     file_path = UPLOAD_DIR / saved_filename
 
     try:
-        content = await file.read()
-        if len(content) > MAX_FILE_SIZE:
-             raise HTTPException(status_code=400, detail="File size exceeds 10MB limit")
-        
-        with open(file_path, "wb") as f:
-            f.write(content)
-            
-        # 3. Get metadata
-        metadata = DocumentProcessor.get_metadata(str(file_path))
-        
-        # 4. Create database entry
+        stored = await save_upload_file(file, file_path, MAX_FILE_SIZE)
+    except FileTooLargeError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Upload failed: {str(e)}")
+
+    # 3. Duplicate upload: reuse the existing file and vectors
+    source_doc = db.query(models.Document).filter(
+        models.Document.content_hash == stored["sha256"],
+        models.Document.processed == True,
+        models.Document.processing_error.is_(None)
+    ).first()
+    if source_doc and os.path.exists(source_doc.file_path):
+        os.remove(file_path)
+        try:
+            return await register_duplicate(db, source_doc, file_id, file.filename)
+        except Exception as e:
+            db.rollback()
+            await asyncio.to_thread(vector_store.delete_document, file_id)
+            raise HTTPException(status_code=500, detail=f"Upload failed: {str(e)}")
+
+    try:
+        # 4. Create database entry (page count is filled in once the
+        #    ingestion job has parsed the document)
         db_doc = models.Document(
             id=file_id,
             filename=saved_filename,
             original_filename=file.filename,
             file_path=str(file_path),
-            file_size=metadata["file_size"],
-            page_count=metadata.get("page_count", 1),
+            file_size=stored["file_size"],
+            content_hash=stored["sha256"],
+            page_count=0,
             processed=False
         )
         db.add(db_doc)
         db.commit()
         db.refresh(db_doc)
 
-        # 5. Queue background processing
-        background_tasks.add_task(
-            process_document_background, 
-            file_id, 
-            file.filename, 
-            str(file_path), 
-            db
-        )
+        # 5. Queue background processing (durable job, bounded worker pool)
+        ingestion_queue.enqueue(db, file_id)
 
         return {
             "document_id": file_id,
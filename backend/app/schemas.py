@@ -20,6 +20,19 @@ class Document(DocumentBase):
     
     model_config = ConfigDict(from_attributes=True)
 
+class IngestionJob(BaseModel):
+    id: str
+    document_id: str
+    state: str
+    attempts: int
+    error: Optional[str] = None
+    created_at: datetime
+    updated_at: datetime
+    started_at: Optional[datetime] = None
+    finished_at: Optional[datetime] = None
+
+    model_config = ConfigDict(from_attributes=True)
+
 class MessageBase(BaseModel):
     role: str
     content: str
@@ -30,6 +43,7 @@ class MessageCreate(MessageBase):
 
 class Message(MessageBase):
     id: str
+    truncated: Optional[bool] = False
     created_at: datetime
     
     model_config = ConfigDict(from_attributes=True)
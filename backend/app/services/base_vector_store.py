@@ -0,0 +1,147 @@
+"""
+Vector Store Interface for ChatPDF
+Abstract base class shared by the ChromaDB and NumPy backends.
+"""
+from abc import ABC, abstractmethod
+from typing import List, Dict, Any, Iterator, Set
+
+from .query_cache import query_cache
+
+
+class BaseVectorStore(ABC):
+    """
+    Interface shared by all vector store backends.
+
+    Public write methods handle chunk ID generation and query-cache
+    invalidation; backends implement the underscore-prefixed primitives.
+    Chunk data is exchanged as dicts with parallel "ids", "documents",
+    "embeddings" and "metadatas" lists.
+    """
+
+    backend_name = "base"
+
+    def add_chunks(
+        self,
+        doc_id: str,
+        chunks: List[str],
+        embeddings: List[List[float]],
+        metadatas: List[Dict[str, Any]]
+    ):
+        """Add document chunks to the vector store."""
+        # Generate unique IDs for each chunk
+        ids = [f"{doc_id}_{i}" for i in range(len(chunks))]
+
+        # Add document_id to each metadata
+        for meta in metadatas:
+            meta["document_id"] = doc_id
+
+        self._upsert(ids, chunks, embeddings, metadatas)
+        self._invalidate(doc_id)
+
+    def upsert_chunks(
+        self,
+        ids: List[str],
+        chunks: List[str],
+        embeddings: List[List[float]],
+        metadatas: List[Dict[str, Any]]
+    ):
+        """Write chunks with explicit IDs (used for migrations between backends)."""
+        self._upsert(ids, chunks, embeddings, metadatas)
+        for doc_id in {meta["document_id"] for meta in metadatas}:
+            self._invalidate(doc_id)
+
+    def delete_document(self, doc_id: str):
+        """Remove all chunks associated with a document."""
+        self._delete_document(doc_id)
+        self._invalidate(doc_id)
+
+    def clone_document(self, source_doc_id: str, target_doc_id: str, filename: str) -> int:
+        """
+        Copy all chunk vectors of one document under a new document ID.
+        Used for duplicate uploads so no re-extraction or re-embedding is needed.
+
+        Returns:
+            int: Number of chunks cloned
+        """
+        results = self.get_document_chunks(source_doc_id)
+        source_ids = results["ids"]
+        if not source_ids:
+            return 0
+
+        prefix = f"{source_doc_id}_"
+        ids = [f"{target_doc_id}_{chunk_id[len(prefix):]}" for chunk_id in source_ids]
+        metadatas = []
+        for meta in results["metadatas"]:
+            meta = dict(meta)
+            meta["document_id"] = target_doc_id
+            meta["filename"] = filename
+            metadatas.append(meta)
+
+        batch_size = 1000
+        for i in range(0, len(ids), batch_size):
+            self._upsert(
+                ids[i:i + batch_size],
+                results["documents"][i:i + batch_size],
+                results["embeddings"][i:i + batch_size],
+                metadatas[i:i + batch_size]
+            )
+        self._invalidate(target_doc_id)
+        return len(ids)
+
+    def list_ids(self) -> Set[str]:
+        """IDs of every stored chunk. Backends override this to skip loading vectors."""
+        ids = set()
+        for batch in self.iter_chunks():
+            ids.update(batch["ids"])
+        return ids
+
+    def _invalidate(self, doc_id: str):
+        """Called after a document's chunks change; drops derived caches."""
+        query_cache.invalidate_document(doc_id)
+
+    @abstractmethod
+    def query(
+        self,
+        query_embedding: List[float],
+        n_results: int = 5,
+        doc_ids: List[str] = None
+    ) -> Dict[str, Any]:
+        """
+        Query the vector store for similar chunks.
+        Returns nested "ids", "documents", "metadatas" and "distances"
+        (cosine distance, 1 - similarity) lists, best first.
+        """
+
+    @abstractmethod
+    def get_chunks(self, ids: List[str]) -> Dict[str, List[Any]]:
+        """Chunks with the given IDs (missing IDs are skipped), without embeddings."""
+
+    @abstractmethod
+    def get_document_chunks(self, doc_id: str) -> Dict[str, List[Any]]:
+        """All chunks of one document, including embeddings."""
+
+    @abstractmethod
+    def iter_chunks(self, batch_size: int = 500) -> Iterator[Dict[str, List[Any]]]:
+        """Iterate over every stored chunk in batches, including embeddings."""
+
+    @abstractmethod
+    def get_collection_stats(self) -> Dict[str, Any]:
+        """Get collection statistics for health checks."""
+
+    @abstractmethod
+    def drop(self):
+        """Permanently delete this collection's storage."""
+
+    @abstractmethod
+    def _upsert(
+        self,
+        ids: List[str],
+        chunks: List[str],
+        embeddings: List[List[float]],
+        metadatas: List[Dict[str, Any]]
+    ):
+        """Insert or overwrite chunks by ID."""
+
+    @abstractmethod
+    def _delete_document(self, doc_id: str):
+        """Remove a document's chunks from the backend."""
@@ -1,23 +1,120 @@
 """
 Chat Service for ChatPDF
-Handles RAG pipeline: embed question → query vectors → generate answer with Gemini
+Handles RAG pipeline: embed question → query vectors (+ BM25) → generate answer with Gemini
 """
 from typing import List, Dict, Any, AsyncGenerator
-import re
+import asyncio
 
-from .embeddings import embedding_service
+from ..config import settings
 from .vector_store import vector_store
+from .query_cache import query_cache
+from .lexical_index import reciprocal_rank_fusion
+from .context_packer import expand_neighbors, pack_context
 from .llm import gemini_client
+from .citation_extractor import CitationExtractor
+from .stage_timings import StageTimings
 
 
 class ChatService:
     def __init__(self):
         self.llm = gemini_client
     
+    async def retrieve(
+        self,
+        question: str,
+        doc_ids: List[str] = None,
+        timings: StageTimings = None
+    ) -> Dict[str, Any]:
+        """
+        Retrieve top chunks for a question. Independent steps overlap: the
+        BM25 search runs while the question is embedded, and blocking store
+        queries run in worker threads so the event loop keeps streaming.
+        
+        Args:
+            question: User's question
+            doc_ids: Optional list of document IDs to search within
+            timings: Stage timings of the request
+            
+        Returns:
+            dict: Vector-store shaped results (raises if the search fails)
+        """
+        timings = timings or StageTimings()
+        with timings.stage("retrieve"):
+            return await self._retrieve(question, doc_ids, timings)
+
+    async def _retrieve(self, question: str, doc_ids: List[str], timings: StageTimings) -> Dict[str, Any]:
+        n_results = settings.retrieval_top_k
+        cache_key = query_cache.make_key(question, doc_ids, n_results)
+        cached = query_cache.get(cache_key) if settings.query_cache_size > 0 else None
+
+        if cached and cached.results is not None:
+            # Cache hit: skip both the embedding call and the vector query
+            timings.mark("cache_hit")
+            return cached.results
+
+        generation = query_cache.generation
+        mode = settings.retrieval_mode
+        candidates = max(n_results, settings.retrieval_candidates) if mode == "hybrid" else n_results
+        question_embedding = None
+
+        async def lexical_search():
+            with timings.stage("lexical"):
+                return await asyncio.to_thread(
+                    vector_store.lexical_query, question, n_results=candidates, doc_ids=doc_ids
+                )
+
+        # BM25 needs no embedding, so start it first and let it run alongside
+        lexical_task = asyncio.create_task(lexical_search()) if mode != "vector" else None
+        try:
+            if mode != "lexical":
+                # 1. Embed question (reuse the cached embedding if results went stale);
+                #    questions are embedded with the active collection's profile
+                embedder = vector_store.embedder
+                try:
+                    with timings.stage("embed"):
+                        if cached and cached.embedding is not None:
+                            question_embedding = cached.embedding
+                        else:
+                            question_embedding = await embedder.aembed_text(question)
+                except Exception as e:
+                    print(f"⚠️  Question embedding failed, using lexical retrieval: {e}")
+                    question_embedding = None
+
+            # 2. Retrieve: vector, BM25, or both fused by reciprocal rank.
+            #    Without a usable embedding (lexical mode or embedding API down)
+            #    the lexical index answers on its own
+            if not question_embedding or not any(question_embedding):
+                question_embedding = None
+                lexical_results = await (lexical_task or lexical_search())
+                search_results = reciprocal_rank_fusion([lexical_results], n_results)
+            else:
+                with timings.stage("vector"):
+                    vector_results = await asyncio.to_thread(
+                        vector_store.query,
+                        question_embedding,
+                        n_results=candidates,
+                        doc_ids=doc_ids,
+                        embedder=embedder
+                    )
+                if lexical_task:
+                    search_results = reciprocal_rank_fusion([vector_results, await lexical_task], n_results)
+                else:
+                    search_results = vector_results
+        finally:
+            if lexical_task and not lexical_task.done():
+                lexical_task.cancel()
+
+        # Results from the embedding-down fallback are not cached
+        if settings.query_cache_size > 0 and (question_embedding is not None or mode == "lexical"):
+            query_cache.put(cache_key, question_embedding, search_results, generation)
+        return search_results
+
     async def generate_answer(
         self, 
         question: str, 
-        doc_ids: List[str] = None
+        doc_ids: List[str] = None,
+        retrieval: "asyncio.Future" = None,
+        timings: StageTimings = None
     ) -> AsyncGenerator[Dict[str, Any], None]:
         """
         Generate a streaming answer with citations using Gemini.
@@ -25,67 +122,73 @@ class ChatService:
         Args:
             question: User's question
             doc_ids: Optional list of document IDs to search within
+            retrieval: Already-started `retrieve()` task, so callers can
+                overlap their own work (DB writes) with embedding and search
+            timings: Stage timings of the request, streamed as a `timings` event
             
         Yields:
             dict: Stream events with type and content
         """
-        # 1. Embed question
-        try:
-            question_embedding = embedding_service.embed_text(question)
-        except Exception as e:
-            yield {"type": "error", "content": f"Embedding failed: {str(e)}"}
-            return
-
-        # 2. Query vector store
+        timings = timings or StageTimings()
         try:
-            search_results = vector_store.query(
-                question_embedding, 
-                n_results=5, 
-                doc_ids=doc_ids
-            )
+            search_results = await (retrieval or self.retrieve(question, doc_ids, timings))
         except Exception as e:
             yield {"type": "error", "content": f"Vector search failed: {str(e)}"}
             return
         
         chunks = search_results.get("documents", [[]])[0]
-        metadatas = search_results.get("metadatas", [[]])[0]
 
         if not chunks:
             yield {
                 "type": "chunk", 
                 "content": "No relevant documents found. Please upload some PDFs first."
             }
+            yield {"type": "timings", "data": timings.as_dict()}
             yield {"type": "done", "full_content": "", "citations": []}
             return
 
-        # 3. Build context for RAG prompt
-        context_chunks = []
-        for chunk, meta in zip(chunks, metadatas):
-            context_chunks.append({
-                "text": chunk,
-                "filename": meta.get("filename", "Unknown"),
-                "page": meta.get("page", 0)
-            })
+        # 3. Build context for RAG prompt: widen hits with neighbouring
+        #    chunks, threshold, de-duplicate, merge and pack to the token budget
+        hits = len(chunks)
+        if settings.neighbor_window > 0:
+            try:
+                with timings.stage("expand"):
+                    search_results = await asyncio.to_thread(
+                        expand_neighbors, search_results, vector_store.get_chunks, settings.neighbor_window
+                    )
+            except Exception as e:
+                print(f"⚠️  Neighbor expansion failed: {e}")
+        with timings.stage("pack"):
+            context_chunks, packing = pack_context(
+                search_results,
+                token_budget=settings.context_token_budget,
+                min_similarity=settings.context_min_similarity,
+                dedup_threshold=settings.context_dedup_threshold
+            )
+        packing["neighbors_added"] = packing["retrieved"] - hits
+        yield {"type": "context", "data": packing}
         
         prompt = self.llm.build_rag_prompt(question, context_chunks)
 
-        # 4. Stream from Gemini (native async)
+        # 4. Stream from Gemini (native async); citations are extracted as
+        #    the answer streams and sent as soon as each marker is complete
+        extractor = CitationExtractor(context_chunks, [c["text"] for c in context_chunks])
         try:
-            full_content = ""
+            parts = []
             
-            async for token in self.llm.generate_stream(prompt):
-                full_content += token
-                yield {"type": "chunk", "content": token}
-            
-            # 5. Parse Citations
-            citations = self.parse_citations(full_content, metadatas, chunks)
-            for citation in citations:
-                yield {"type": "citation", "data": citation}
+            with timings.stage("generate"):
+                async for token in self.llm.generate_stream(prompt):
+                    timings.mark("first_token")
+                    parts.append(token)
+                    yield {"type": "chunk", "content": token}
+                    for citation in extractor.feed(token):
+                        yield {"type": "citation", "data": citation}
             
+            yield {"type": "timings", "data": timings.as_dict()}
             yield {
                 "type": "done", 
-                "full_content": full_content, 
-                "citations": citations
+                "full_content": "".join(parts), 
+                "citations": extractor.citations
             }
 
         except Exception as e:
@@ -98,7 +201,7 @@ class ChatService:
         chunks: List[str]
     ) -> List[Dict[str, Any]]:
         """
-        Extract [Filename, Page X] citations and match with metadata.
+        Extract [Filename, Page X] citations from a complete text and match with metadata.
         
         Args:
             text: Generated response text
@@ -108,34 +211,28 @@ class ChatService:
         Returns:
             List of citation dicts with document info
         """
-        pattern = r'\[([^,]+),\s*Page\s*(\d+)\]'
-        found = []
-        seen = set()
-        
-        for match in re.finditer(pattern, text):
-            filename = match.group(1).strip()
-            page = int(match.group(2))
-            
-            citation_key = f"{filename}_{page}"
-            if citation_key in seen:
-                continue
-                
-            # Find matching chunk in search results
-            for meta, chunk in zip(metadatas, chunks):
-                if meta.get('filename') == filename and meta.get('page') == page:
-                    found.append({
-                        "document_id": meta.get('document_id', ''),
-                        "filename": filename,
-                        "page": page,
-                        "chunk_text": chunk[:200] + "..." if len(chunk) > 200 else chunk
-                    })
-                    seen.add(citation_key)
-                    break
-        return found
-
-    def generate_title(self, first_message: str) -> str:
+        extractor = CitationExtractor(metadatas, chunks)
+        extractor.feed(text)
+        return extractor.citations
+
+    @staticmethod
+    def placeholder_title(first_message: str) -> str:
+        """
+        Title derived locally from the question, used until the generated
+        title arrives (or kept if title generation fails).
+        """
+        words = first_message.split()
+        title = " ".join(words[:8])
+        if len(title) > 50:
+            title = title[:47].rstrip() + "..."
+        elif len(words) > 8:
+            title += "..."
+        return title or "New Conversation"
+
+    async def generate_title(self, first_message: str) -> str:
         """
         Generate a short title based on the first user message.
+        Runs alongside retrieval and answer streaming, never before them.
         
         Args:
             first_message: The user's first question
@@ -149,14 +246,14 @@ class ChatService:
                 f"that starts with: '{first_message}'. "
                 f"Respond only with the title, no quotes or explanations."
             )
-            title = self.llm.generate(prompt)
+            title = await self.llm.agenerate(prompt)
             # Clean up response
             title = title.strip().replace('"', '').replace("'", "")
             # Truncate if too long
-            return title[:50] if title else "New Conversation"
+            return title[:50] if title else self.placeholder_title(first_message)
         except Exception as e:
             print(f"Error generating title: {e}")
-            return "New Conversation"
+            return self.placeholder_title(first_message)
 
 
 # Singleton instance
@@ -0,0 +1,85 @@
+"""
+Streaming Citation Extractor for ChatPDF
+Finds [Filename, Page X] markers in the answer as it streams, token by token,
+and resolves each against the request's context chunks through a
+(filename, page) index, so citations can be sent before the answer ends.
+"""
+from typing import Any, Dict, List, Tuple
+import re
+
+CITATION_PATTERN = re.compile(r'\[([^,]+),\s*Page\s*(\d+)\]')
+# The unfinished end of a marker, e.g. "[report[v2].pd" or "[a.pdf, Pa"
+PARTIAL_PATTERN = re.compile(r'\[[^,]*(?:,\s*(?:P(?:a(?:g(?:e\s*\d*)?)?)?)?)?\Z')
+# An unclosed "[" further back than this is not a citation; stop buffering it
+MAX_MARKER_CHARS = 256
+# Length of the chunk excerpt attached to a citation
+EXCERPT_CHARS = 200
+
+
+class CitationExtractor:
+    """
+    Incremental citation parser for one answer.
+
+    Text from the first "[" that could still begin a marker is carried over
+    to the next token, so markers split across tokens are still found;
+    everything before it has already been scanned and is never looked at
+    again. Filenames may contain brackets, so a match is only accepted if
+    its (filename, page) is one of the context chunks.
+    """
+
+    def __init__(self, metadatas: List[Dict[str, Any]], chunks: List[str]):
+        # First (best-ranked) chunk per (filename, page)
+        self._index: Dict[Tuple[str, int], Tuple[Dict[str, Any], str]] = {}
+        for meta, chunk in zip(metadatas, chunks):
+            self._index.setdefault((meta.get('filename'), meta.get('page')), (meta, chunk))
+        self._pending = ""
+        self._seen = set()
+        self.citations: List[Dict[str, Any]] = []
+
+    def feed(self, token: str) -> List[Dict[str, Any]]:
+        """
+        Scan the next piece of the answer.
+
+        Returns:
+            List of citations completed by this token (each reported once)
+        """
+        text = self._pending + token
+        found = []
+        scanned = 0
+        for match in CITATION_PATTERN.finditer(text):
+            scanned = match.end()
+            citation = self._resolve(match.group(1), int(match.group(2)))
+            if citation:
+                found.append(citation)
+
+        tail = text[scanned:][-MAX_MARKER_CHARS:]
+        partial = PARTIAL_PATTERN.search(tail)
+        self._pending = tail[partial.start():] if partial else ""
+        return found
+
+    def _resolve(self, raw_filename: str, page: int):
+        # The match starts at the first "[" after the previous marker; the
+        # real filename may start after any later "[" ("see [1] and [a.pdf, Page 2]")
+        starts = [0] + [i + 1 for i, ch in enumerate(raw_filename) if ch == '[']
+        for start in starts:
+            filename = raw_filename[start:].strip()
+            if (filename, page) in self._index:
+                break
+        else:
+            return None
+        key = (filename, page)
+        if key in self._seen:
+            return None
+        self._seen.add(key)
+        meta, chunk = self._index[key]
+        citation = {
+            "document_id": meta.get('document_id', ''),
+            "filename": filename,
+            "page": page,
+            "chunk_text": chunk[:EXCERPT_CHARS] + "..." if len(chunk) > EXCERPT_CHARS else chunk
+        }
+        # Word/HTML/Markdown "pages" are sections; name the heading
+        if meta.get('section_title'):
+            citation["section_title"] = meta['section_title']
+        self.citations.append(citation)
+        return citation
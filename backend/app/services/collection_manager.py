@@ -0,0 +1,387 @@
+"""
+Versioned Vector Collections for ChatPDF
+Every embedding profile (model + output size) is stored in its own collection.
+When the configured profile changes, a replacement collection is rebuilt in
+the background from the stored chunk text while queries keep using the old
+one; the active collection is then switched atomically.
+"""
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterator, List, Optional, Set
+import json
+import os
+import threading
+import time
+
+from ..config import settings
+from .base_vector_store import BaseVectorStore
+from .embeddings import EmbeddingService, embedding_service, DEFAULT_EMBEDDING_MODEL
+from .lexical_index import LexicalIndex
+from .query_cache import query_cache
+
+# File (next to the backend's data) naming the collection that serves queries
+REGISTRY_FILE = "active_collection.json"
+
+# Rebuild states
+REBUILD_IDLE = "idle"
+REBUILD_RUNNING = "running"
+REBUILD_DONE = "done"
+REBUILD_FAILED = "failed"
+
+# Catch-up passes (embedding and throttling) run without the write lock; the
+# lock is only taken to confirm nothing is missing and switch. Writes that keep
+# outpacing this many passes fail the attempt, which is retried later
+MAX_CATCH_UP_PASSES = 10
+# Seconds to wait before retrying a failed rebuild (progress is kept)
+REBUILD_RETRY_SECONDS = 60
+# The previous collection stays queryable this long after the switch so
+# in-flight requests embedded with the old profile can finish
+RETIRE_GRACE_SECONDS = 10
+
+
+class VersionedVectorStore(BaseVectorStore):
+    """
+    Vector store facade that serves the active collection version.
+
+    `embedder` is the EmbeddingService for the active collection's profile;
+    callers must embed questions and chunks with it (and pass it back to
+    `query` / `add_chunks`) so vectors are never mixed across profiles.
+    Writes go to the active collection; while a rebuild runs, added chunks,
+    clones and deletes are mirrored to the new collection, and anything
+    still missing is picked up by catch-up passes before the switch.
+    Embedding calls never run under the write lock.
+    """
+
+    def __init__(self, factory: Callable[..., BaseVectorStore], backend: str = None):
+        self.factory = factory
+        self.backend_name = (backend or settings.vector_backend).lower()
+        root = settings.vector_index_dir if self.backend_name == "numpy" else settings.chroma_persist_dir
+        self.registry_path = Path(root) / REGISTRY_FILE
+
+        self.target_profile = embedding_service.profile
+        registry = self._read_registry()
+        if registry:
+            profile = {"model": registry["model"], "dimensions": registry["dimensions"]}
+        else:
+            # Collections created before versioning used the fixed default model
+            profile = {"model": DEFAULT_EMBEDDING_MODEL, "dimensions": settings.embedding_dimensions}
+
+        self.active_profile = profile
+        self.active = factory(self.backend_name, dimensions=profile["dimensions"], model=profile["model"])
+        self.embedder = self._embedder_for(profile)
+        if not registry:
+            self._write_registry(profile)
+
+        # BM25 index over chunk text; independent of the embedding profile,
+        # so it is shared across collection versions
+        self.lexical = LexicalIndex(settings.lexical_index_path)
+
+        # Serializes writes with the final catch-up pass and the switch
+        self._write_lock = threading.RLock()
+        self._building: Optional[BaseVectorStore] = None
+        self._building_embedder: Optional[EmbeddingService] = None
+        # IDs already in the collection being built (shared with mirrored writes)
+        self._building_ids: Set[str] = set()
+        self._retired: Optional[BaseVectorStore] = None
+        self._retired_embedder: Optional[EmbeddingService] = None
+        self._thread: Optional[threading.Thread] = None
+        self._stop = threading.Event()
+        self._progress: Dict[str, Any] = {"state": REBUILD_IDLE}
+
+        if self.needs_rebuild:
+            print(
+                f"⚠️  Active collection uses {profile['model']} ({profile['dimensions']}d); "
+                f"configured profile is {self.target_profile['model']} ({self.target_profile['dimensions']}d). "
+                "Rebuilding in the background"
+            )
+
+    # ------------------------------------------------------------------ #
+    # Registry
+    # ------------------------------------------------------------------ #
+
+    def _read_registry(self) -> Optional[Dict[str, Any]]:
+        try:
+            with open(self.registry_path) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def _write_registry(self, profile: Dict[str, Any]):
+        """Atomically replace the registry file."""
+        self.registry_path.parent.mkdir(parents=True, exist_ok=True)
+        data = {"backend": self.backend_name, **profile, "activated_at": time.time()}
+        tmp_path = self.registry_path.with_suffix(".tmp")
+        with open(tmp_path, "w") as f:
+            json.dump(data, f)
+        os.replace(tmp_path, self.registry_path)
+
+    def _embedder_for(self, profile: Dict[str, Any]) -> EmbeddingService:
+        if profile == embedding_service.profile:
+            return embedding_service
+        return EmbeddingService(model_name=profile["model"], dimensions=profile["dimensions"])
+
+    @property
+    def needs_rebuild(self) -> bool:
+        return self.active_profile != self.target_profile
+
+    # ------------------------------------------------------------------ #
+    # Background rebuild
+    # ------------------------------------------------------------------ #
+
+    def start_rebuild_if_needed(self):
+        """Start the background rebuild if the configured profile is not active."""
+        if not self.needs_rebuild or (self._thread and self._thread.is_alive()):
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._rebuild_loop, name="vector-rebuild", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+
+    def _rebuild_loop(self):
+        while not self._stop.is_set():
+            try:
+                self._rebuild()
+                return
+            except Exception as e:
+                self._progress.update(state=REBUILD_FAILED, error=str(e))
+                print(f"❌ Collection rebuild failed, retrying in {REBUILD_RETRY_SECONDS}s: {e}")
+                self._stop.wait(REBUILD_RETRY_SECONDS)
+
+    def _rebuild(self):
+        profile = dict(self.target_profile)
+        embedder = self._embedder_for(profile)
+        target = self.factory(self.backend_name, dimensions=profile["dimensions"], model=profile["model"])
+
+        # Chunks already in the target (an interrupted rebuild or a prior
+        # `cli reindex`) are not re-embedded
+        copied = target.list_ids()
+        with self._write_lock:
+            self._building, self._building_embedder, self._building_ids = target, embedder, copied
+        source_stats = self.active.get_collection_stats()
+        self._progress = {
+            "state": REBUILD_RUNNING,
+            "source": source_stats["name"],
+            "target": target.get_collection_stats()["name"],
+            "profile": profile,
+            "total": source_stats["count"],
+            "copied": len(copied),
+            "reembedded": 0,
+            "started_at": time.time(),
+            "error": None
+        }
+        print(f"🚚 Rebuilding {self._progress['source']} → {self._progress['target']} ({source_stats['count']} chunks)")
+
+        try:
+            for _ in range(MAX_CATCH_UP_PASSES):
+                self._copy_missing(target, embedder, copied)
+                if self._stop.is_set():
+                    return
+                # Only the completeness check and the switch hold the lock;
+                # anything written since the pass means another pass
+                with self._write_lock:
+                    live_ids = self.active.list_ids()
+                    if live_ids - copied:
+                        continue
+                    self._drop_stale_documents(target, copied, live_ids)
+
+                    retired = self.active
+                    self._retired, self._retired_embedder = retired, self.embedder
+                    self.active, self.active_profile, self.embedder = target, profile, embedder
+                    self._building = None
+                    self._write_registry(profile)
+                    # Cached question embeddings belong to the old profile
+                    query_cache.clear()
+                    break
+            else:
+                raise RuntimeError(f"Writes outpaced {MAX_CATCH_UP_PASSES} catch-up passes")
+        finally:
+            with self._write_lock:
+                if self._building is target:
+                    self._building = None
+
+        elapsed = time.time() - self._progress["started_at"]
+        self._progress.update(state=REBUILD_DONE, finished_at=time.time())
+        print(f"✅ Switched to collection {self._progress['target']} after {elapsed:.1f}s")
+
+        self._stop.wait(RETIRE_GRACE_SECONDS)
+        with self._write_lock:
+            self._retired, self._retired_embedder = None, None
+        if settings.reembed_drop_old:
+            retired.drop()
+            print(f"🗑️  Dropped previous collection {self._progress['source']}")
+
+    def _copy_missing(self, target: BaseVectorStore, embedder: EmbeddingService, copied: Set[str]) -> int:
+        """Re-embed every active chunk not yet in the target. Returns the number copied."""
+        count = 0
+        rate = settings.reembed_max_chunks_per_sec
+        for batch in self.active.iter_chunks(batch_size=settings.reembed_batch_size):
+            keep = [i for i, chunk_id in enumerate(batch["ids"]) if chunk_id not in copied]
+            if not keep:
+                continue
+            started = time.monotonic()
+            ids = [batch["ids"][i] for i in keep]
+            texts = [batch["documents"][i] for i in keep]
+            metadatas = [batch["metadatas"][i] for i in keep]
+
+            # Cache hits (same text embedded before under this profile) are free
+            vectors = embedder.embed_chunks(texts)
+            if any(not any(v) for v in vectors):
+                raise RuntimeError("Embedding API returned no vector for some chunks")
+            target.upsert_chunks(ids, texts, vectors, metadatas)
+
+            copied.update(ids)
+            count += len(ids)
+            self._progress["copied"] = len(copied)
+            self._progress["reembedded"] += len(ids)
+
+            if rate > 0:
+                # Leave embedding quota for live ingestion and queries
+                self._stop.wait(max(0.0, len(ids) / rate - (time.monotonic() - started)))
+            if self._stop.is_set():
+                break
+        return count
+
+    def _drop_stale_documents(self, target: BaseVectorStore, copied: Set[str], live_ids: Set[str]):
+        """Remove documents from the target that no longer exist in the active collection."""
+        live_docs = {chunk_id.rsplit("_", 1)[0] for chunk_id in live_ids}
+        stale_docs = {chunk_id.rsplit("_", 1)[0] for chunk_id in copied} - live_docs
+        for doc_id in stale_docs:
+            target.delete_document(doc_id)
+
+    def rebuild_status(self) -> Dict[str, Any]:
+        """Progress of the current (or last) rebuild."""
+        status = dict(self._progress)
+        if status["state"] == REBUILD_RUNNING and status["total"]:
+            status["percent"] = round(100 * min(status["copied"], status["total"]) / status["total"], 1)
+            elapsed = time.time() - status["started_at"]
+            if status["reembedded"]:
+                remaining = max(0, status["total"] - status["copied"])
+                status["eta_seconds"] = round(remaining * elapsed / status["reembedded"], 1)
+        return status
+
+    # ------------------------------------------------------------------ #
+    # Vector store interface (delegates to the active collection)
+    # ------------------------------------------------------------------ #
+
+    def _store_for(self, embedder: Optional[EmbeddingService]) -> BaseVectorStore:
+        retired = self._retired
+        if embedder is not None and retired is not None and embedder is self._retired_embedder:
+            return retired
+        return self.active
+
+    def add_chunks(self, doc_id, chunks, embeddings, metadatas, embedder: EmbeddingService = None):
+        """
+        Add document chunks to the active collection (and to the collection
+        being rebuilt, if any). If the collection was switched after
+        `embeddings` were computed with `embedder`, the chunks are re-embedded
+        with the new profile first. Embedding happens before the write lock
+        is taken; a switch in the meantime just means another round.
+        """
+        ids = [f"{doc_id}_{i}" for i in range(len(chunks))]
+        while True:
+            active_embedder = self.embedder
+            building, building_embedder = self._building, self._building_embedder
+            if embedder is not None and embedder is not active_embedder:
+                embeddings, embedder = active_embedder.embed_chunks(chunks), active_embedder
+            building_vectors = None
+            if building is not None:
+                building_vectors = building_embedder.embed_chunks(chunks)
+                if any(not any(v) for v in building_vectors):
+                    # Leave these to the rebuild's catch-up pass
+                    building_vectors = None
+
+            with self._write_lock:
+                if embedder is not None and embedder is not self.embedder:
+                    continue
+                self.active.add_chunks(doc_id, chunks, embeddings, metadatas)
+                if building_vectors is not None and self._building is building:
+                    building.add_chunks(doc_id, chunks, building_vectors, metadatas)
+                    self._building_ids.update(ids)
+                self.lexical.upsert(ids, chunks, metadatas)
+                return
+
+    def upsert_chunks(self, ids, chunks, embeddings, metadatas):
+        with self._write_lock:
+            self.active.upsert_chunks(ids, chunks, embeddings, metadatas)
+            self.lexical.upsert(ids, chunks, metadatas)
+
+    def delete_document(self, doc_id: str):
+        with self._write_lock:
+            self.active.delete_document(doc_id)
+            if self._building is not None:
+                self._building.delete_document(doc_id)
+            self.lexical.delete_document(doc_id)
+
+    def clone_document(self, source_doc_id: str, target_doc_id: str, filename: str) -> int:
+        with self._write_lock:
+            cloned = self.active.clone_document(source_doc_id, target_doc_id, filename)
+            if cloned:
+                results = self.active.get_document_chunks(target_doc_id)
+                self.lexical.upsert(results["ids"], results["documents"], results["metadatas"])
+                # Stored vectors are copied, no embedding call; a source not yet
+                # rebuilt clones nothing and is caught up by the rebuild instead
+                if self._building is not None and self._building.clone_document(source_doc_id, target_doc_id, filename):
+                    self._building_ids.update(results["ids"])
+            return cloned
+
+    def query(
+        self,
+        query_embedding: List[float],
+        n_results: int = 5,
+        doc_ids: List[str] = None,
+        embedder: EmbeddingService = None
+    ) -> Dict[str, Any]:
+        """Query the collection matching the profile the question was embedded with."""
+        return self._store_for(embedder).query(query_embedding, n_results=n_results, doc_ids=doc_ids)
+
+    def lexical_query(self, question: str, n_results: int = 5, doc_ids: List[str] = None) -> Dict[str, Any]:
+        """BM25 search over chunk text; needs no embedding call."""
+        return self.lexical.query(question, n_results=n_results, doc_ids=doc_ids)
+
+    def start_lexical_backfill_if_needed(self):
+        """Index existing chunks in the background if the lexical index is out of step."""
+        if self.lexical.count() == self.active.get_collection_stats()["count"]:
+            return
+
+        def backfill():
+            # Runs unlocked and upserts in place, so BM25 keeps serving the old
+            # entries meanwhile; concurrent adds are upserted by add_chunks anyway.
+            # Chunks no longer stored (deleted documents, leftovers of a crash)
+            # are pruned under the lock afterwards
+            indexed = self.lexical.rebuild(self.active.iter_chunks())
+            with self._write_lock:
+                stale = self.lexical.chunk_ids() - self.active.list_ids()
+                self.lexical.delete_chunks(stale)
+            print(f"✅ Lexical index rebuilt: {indexed} chunks ({len(stale)} stale removed)")
+
+        threading.Thread(target=backfill, name="lexical-backfill", daemon=True).start()
+
+    def get_chunks(self, ids: List[str]) -> Dict[str, List[Any]]:
+        return self.active.get_chunks(ids)
+
+    def get_document_chunks(self, doc_id: str) -> Dict[str, List[Any]]:
+        return self.active.get_document_chunks(doc_id)
+
+    def iter_chunks(self, batch_size: int = 500) -> Iterator[Dict[str, List[Any]]]:
+        return self.active.iter_chunks(batch_size=batch_size)
+
+    def list_ids(self) -> Set[str]:
+        return self.active.list_ids()
+
+    def get_collection_stats(self) -> Dict[str, Any]:
+        stats = self.active.get_collection_stats()
+        stats["embedding_model"] = self.active_profile["model"]
+        stats["lexical_chunks"] = self.lexical.count()
+        stats["rebuild"] = self.rebuild_status()
+        return stats
+
+    def drop(self):
+        with self._write_lock:
+            self.active.drop()
+
+    def _upsert(self, ids, chunks, embeddings, metadatas):
+        self.active._upsert(ids, chunks, embeddings, metadatas)
+
+    def _delete_document(self, doc_id: str):
+        self.active._delete_document(doc_id)
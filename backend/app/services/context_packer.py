@@ -0,0 +1,228 @@
+"""
+Context Packer for ChatPDF
+Turns raw retrieval results into the prompt context: expands hits with their
+neighbouring chunks, drops weak matches, removes near-duplicate chunks,
+merges adjacent chunks of the same page and packs the rest, best first,
+into a token budget.
+"""
+from typing import Any, Callable, Dict, List, Optional, Set, Tuple
+import re
+
+# Rough chars-per-token ratio for English text with Gemini tokenizers
+CHARS_PER_TOKEN = 4
+# Words per shingle for near-duplicate detection
+SHINGLE_SIZE = 3
+# Longest chunk overlap (chars) looked for when merging adjacent chunks
+MAX_MERGE_OVERLAP = 200
+
+
+def estimate_tokens(text: str) -> int:
+    return max(1, len(text) // CHARS_PER_TOKEN)
+
+
+def shingles(text: str) -> Set[Tuple[str, ...]]:
+    words = re.findall(r"\w+", text.lower())
+    if len(words) < SHINGLE_SIZE:
+        return {tuple(words)}
+    return {tuple(words[i:i + SHINGLE_SIZE]) for i in range(len(words) - SHINGLE_SIZE + 1)}
+
+
+def jaccard(a: Set, b: Set) -> float:
+    if not a or not b:
+        return 0.0
+    return len(a & b) / len(a | b)
+
+
+def merge_overlapping(first: str, second: str) -> str:
+    """Concatenate two consecutive chunks, dropping the text they share."""
+    for size in range(min(len(first), len(second), MAX_MERGE_OVERLAP), 0, -1):
+        if first.endswith(second[:size]):
+            return first + second[size:]
+    return first + " " + second
+
+
+def chunk_position(chunk_id: Optional[str], meta: Dict[str, Any]) -> Optional[int]:
+    """
+    Document-ordered position of a chunk. Chunk IDs are "{document_id}_{n}"
+    with n counting across the whole document, so chunks indexed before
+    positions were stored in metadata still resolve.
+    """
+    if meta.get("position") is not None:
+        return meta["position"]
+    if chunk_id:
+        suffix = chunk_id.rsplit("_", 1)[-1]
+        if suffix.isdigit():
+            return int(suffix)
+    return meta.get("chunk_index")
+
+
+def expand_neighbors(
+    results: Dict[str, Any],
+    fetch: Callable[[List[str]], Dict[str, List[Any]]],
+    window: int
+) -> Dict[str, Any]:
+    """
+    Small-to-big retrieval: add the `window` chunks before and after every
+    hit, fetched by ID in one batched lookup. Neighbours follow their hit
+    (in document order) and share its distance, so packing keeps or drops
+    the whole window together.
+    """
+    ids = results.get("ids", [[]])[0]
+    if window <= 0 or not ids:
+        return results
+    documents = results.get("documents", [[]])[0]
+    metadatas = results.get("metadatas", [[]])[0]
+    distances = (results.get("distances") or [[]])[0] or [None] * len(ids)
+
+    hit_ids = set(ids)
+    wanted: List[str] = []
+    for chunk_id, meta in zip(ids, metadatas):
+        position = chunk_position(chunk_id, meta)
+        doc_id = meta.get("document_id")
+        if position is None or not doc_id:
+            continue
+        for offset in range(-window, window + 1):
+            neighbor_id = f"{doc_id}_{position + offset}"
+            if offset and position + offset >= 0 and neighbor_id not in hit_ids:
+                wanted.append(neighbor_id)
+
+    fetched = fetch(list(dict.fromkeys(wanted))) if wanted else {"ids": []}
+    neighbors = {
+        chunk_id: (text, meta)
+        for chunk_id, text, meta in zip(fetched["ids"], fetched.get("documents", []), fetched.get("metadatas", []))
+    }
+
+    expanded = {"ids": [], "documents": [], "metadatas": [], "distances": []}
+    seen: Set[str] = set()
+
+    def add(chunk_id, text, meta, distance):
+        if chunk_id in seen:
+            return
+        seen.add(chunk_id)
+        expanded["ids"].append(chunk_id)
+        expanded["documents"].append(text)
+        expanded["metadatas"].append(meta)
+        expanded["distances"].append(distance)
+
+    for chunk_id, text, meta, distance in zip(ids, documents, metadatas, distances):
+        position = chunk_position(chunk_id, meta)
+        doc_id = meta.get("document_id")
+        for offset in range(-window, window + 1):
+            if not offset:
+                add(chunk_id, text, meta, distance)
+            elif position is not None:
+                neighbor_id = f"{doc_id}_{position + offset}"
+                if neighbor_id in neighbors and neighbor_id not in hit_ids:
+                    add(neighbor_id, *neighbors[neighbor_id], distance)
+
+    return {key: [values] for key, values in expanded.items()}
+
+
+def pack_context(
+    results: Dict[str, Any],
+    token_budget: int,
+    min_similarity: float = 0.0,
+    dedup_threshold: float = 1.0
+) -> Tuple[List[Dict[str, Any]], Dict[str, Any]]:
+    """
+    Build prompt context from vector store results.
+
+    Args:
+        results: Query results with "documents", "metadatas" and optionally "distances"
+        token_budget: Upper bound on estimated context tokens
+        min_similarity: Chunks with cosine similarity below this are dropped
+            (chunks without a distance, e.g. lexical-only hits, are kept)
+        dedup_threshold: Shingle Jaccard similarity at which a chunk counts
+            as a near-duplicate of a better-ranked one
+
+    Returns:
+        tuple: (context chunks with 'text', 'filename', 'page', 'document_id'
+        and 'section_title' keys in rank order, packing stats)
+    """
+    documents = results.get("documents", [[]])[0]
+    metadatas = results.get("metadatas", [[]])[0]
+    distances = (results.get("distances") or [[]])[0] or [None] * len(documents)
+    ids = (results.get("ids") or [[]])[0] or [None] * len(documents)
+
+    items = [
+        {"rank": rank, "text": text, "meta": meta, "distance": distance, "position": chunk_position(chunk_id, meta)}
+        for rank, (chunk_id, text, meta, distance) in enumerate(zip(ids, documents, metadatas, distances))
+    ]
+    stats = {
+        "retrieved": len(items),
+        "below_threshold": 0,
+        "near_duplicates": 0,
+        "merged": 0,
+        "over_budget": 0,
+        "packed": 0,
+        "tokens": 0,
+        "token_budget": token_budget,
+        "retrieved_tokens": sum(estimate_tokens(item["text"]) for item in items)
+    }
+
+    # 1. Similarity cutoff (the best match is always kept)
+    relevant = [
+        item for item in items
+        if item["distance"] is None or 1.0 - item["distance"] >= min_similarity
+    ]
+    if not relevant and items:
+        relevant = items[:1]
+    stats["below_threshold"] = len(items) - len(relevant)
+
+    # 2. Near-duplicate removal against better-ranked survivors
+    unique = []
+    for item in relevant:
+        item["shingles"] = shingles(item["text"])
+        if any(jaccard(item["shingles"], kept["shingles"]) >= dedup_threshold for kept in unique):
+            stats["near_duplicates"] += 1
+            continue
+        unique.append(item)
+
+    # 3. Merge consecutive chunks of the same page into one passage
+    groups: Dict[Tuple[Any, Any], List[Dict[str, Any]]] = {}
+    for item in unique:
+        key = (item["meta"].get("document_id"), item["meta"].get("page"))
+        groups.setdefault(key, []).append(item)
+
+    passages = []
+    for group in groups.values():
+        group.sort(key=lambda i: (i["position"] is None, i["position"] or 0))
+        current = dict(group[0])
+        for item in group[1:]:
+            prev_pos, pos = current["position"], item["position"]
+            if prev_pos is not None and pos is not None and pos == prev_pos + 1:
+                current["text"] = merge_overlapping(current["text"], item["text"])
+                current["rank"] = min(current["rank"], item["rank"])
+                current["position"] = pos  # position of the last merged chunk
+                stats["merged"] += 1
+            else:
+                passages.append(current)
+                current = dict(item)
+        passages.append(current)
+
+    # 4. Pack best-first into the token budget
+    passages.sort(key=lambda p: p["rank"])
+    context_chunks = []
+    for passage in passages:
+        text = passage["text"]
+        tokens = estimate_tokens(text)
+        if stats["tokens"] + tokens > token_budget:
+            if context_chunks:
+                stats["over_budget"] += 1
+                continue
+            # Never send an empty context: trim the best passage to fit
+            text = text[:token_budget * CHARS_PER_TOKEN]
+            tokens = estimate_tokens(text)
+        meta = passage["meta"]
+        context_chunks.append({
+            "text": text,
+            "filename": meta.get("filename", "Unknown"),
+            "page": meta.get("page", 0),
+            "document_id": meta.get("document_id", ""),
+            "section_title": meta.get("section_title")
+        })
+        stats["tokens"] += tokens
+
+    stats["packed"] = len(context_chunks)
+    return context_chunks, stats
+
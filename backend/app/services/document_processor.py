@@ -2,11 +2,258 @@
 Universal Document Processor
 Supports: PDF, DOCX, TXT, MD, HTML
 """
-from typing import List, Dict, Any, Optional
+from typing import List, Dict, Any, Optional, Tuple
+from functools import partial
 from pathlib import Path
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+import multiprocessing
 import os
+import signal
+import threading
 from langchain_text_splitters import RecursiveCharacterTextSplitter
 
+from ..config import settings
+from .section_extractor import SectionBuilder, docx_sections, html_sections, markdown_sections, text_sections
+from .extractors import ExtractionError, get_extractor, register_extractor
+
+
+# Shared process pool for parallel PDF extraction (created lazily)
+_pdf_pool: Optional[ProcessPoolExecutor] = None
+_pdf_pool_lock = threading.Lock()
+
+
+# Set inside an isolation child so its PDF pool fits the memory budget (None = no cap)
+_pdf_worker_cap: Optional[int] = None
+# Smallest address-space limit an extraction process can run under (PyMuPDF alone maps ~130 MB)
+MIN_PROCESS_MEMORY_MB = 192
+
+
+def _pdf_worker_count() -> int:
+    workers = settings.pdf_extract_workers or os.cpu_count() or 1
+    return workers if _pdf_worker_cap is None else min(workers, _pdf_worker_cap)
+
+
+def _get_pdf_pool() -> ProcessPoolExecutor:
+    global _pdf_pool
+    with _pdf_pool_lock:
+        if _pdf_pool is None:
+            _pdf_pool = ProcessPoolExecutor(max_workers=_pdf_worker_count())
+        return _pdf_pool
+
+
+def _reset_pdf_pool():
+    global _pdf_pool
+    with _pdf_pool_lock:
+        if _pdf_pool is not None:
+            _pdf_pool.shutdown(wait=False, cancel_futures=True)
+        _pdf_pool = None
+
+
+def _extract_reader_pages(reader, start: int, end: int) -> List[Dict[str, Any]]:
+    """Extract text from pages [start, end) of an open PdfReader."""
+    pages = []
+    for i in range(start, end):
+        page_text = reader.pages[i].extract_text()
+        if page_text:
+            pages.append({
+                "page_number": i + 1,
+                "content": page_text
+            })
+    return pages
+
+
+def _pdf_reader_class(engine: str):
+    """PdfReader of the pure-Python engines (pypdf is PyPDF2's faster successor)."""
+    if engine == "pypdf":
+        from pypdf import PdfReader
+    else:
+        from PyPDF2 import PdfReader
+    return PdfReader
+
+
+def _extract_pdf_page_range(file_path: str, start: int, end: int, engine: str = "pypdf2") -> List[Dict[str, Any]]:
+    """Process pool entry point: open the PDF and extract one page range."""
+    with open(file_path, "rb") as file:
+        reader = _pdf_reader_class(engine)(file)
+        return _extract_reader_pages(reader, start, end)
+
+
+def _isolation_limits(budget_mb: int) -> Tuple[int, Optional[int]]:
+    """
+    Split the extraction memory budget across the isolation child and its
+    PDF pool. RLIMIT_AS is per process and pool workers inherit it, so the
+    pool is capped to as many workers as the budget can hold and each
+    process gets an equal share; the whole group then stays within budget.
+
+    Returns:
+        (per-process address-space limit in bytes, PDF pool worker cap)
+    """
+    if not budget_mb:
+        return 0, None
+    workers = min(_pdf_worker_count(), budget_mb // MIN_PROCESS_MEMORY_MB - 1)
+    if workers <= 1:
+        # No pool: PDFs are extracted in the child itself
+        return budget_mb * 1024 * 1024, 1
+    return budget_mb // (workers + 1) * 1024 * 1024, workers
+
+
+def _isolation_worker_main(conn, memory_bytes: int, pdf_workers: Optional[int]):
+    """
+    Isolated extraction process entry point.
+    Runs in its own process group under an address-space limit and serves
+    extraction requests until it receives None, replying to each file path
+    with ("ok", (pages, page_count)), ("oom", message) or ("error", message).
+    Its PDF pool lives as long as the process and is reused across documents.
+    """
+    global _pdf_worker_cap
+    _pdf_worker_cap = pdf_workers
+    if hasattr(os, "setpgrp"):
+        os.setpgrp()
+    if memory_bytes:
+        import resource
+        resource.setrlimit(resource.RLIMIT_AS, (memory_bytes, memory_bytes))
+    try:
+        while True:
+            try:
+                file_path = conn.recv()
+            except EOFError:
+                break
+            if file_path is None:
+                break
+            try:
+                result = ("ok", DocumentProcessor._extract(file_path))
+            except MemoryError:
+                result = ("oom", f"Extraction exceeded the {settings.extraction_memory_mb} MB memory limit")
+            except Exception as e:
+                result = ("error", str(e) or type(e).__name__)
+            conn.send(result)
+    finally:
+        _reset_pdf_pool()
+        conn.close()
+
+
+class _IsolationWorker:
+    """A long-lived extraction child and the pipe used to talk to it."""
+
+    def __init__(self, memory_bytes: int, pdf_workers: Optional[int]):
+        # spawn, not fork: the server process runs threads (workers, HTTP clients)
+        ctx = multiprocessing.get_context("spawn")
+        self.limits = (memory_bytes, pdf_workers)
+        self.conn, child_conn = ctx.Pipe()
+        # Not a daemon (daemons cannot start the PDF pool); the child exits
+        # when it reads EOF, i.e. once the parent's end of the pipe is closed
+        self.process = ctx.Process(target=_isolation_worker_main, args=(child_conn, memory_bytes, pdf_workers))
+        self.process.start()
+        child_conn.close()
+
+    def alive(self) -> bool:
+        return self.process.is_alive()
+
+    def stop(self):
+        """Ask the child to exit, killing it if it does not."""
+        try:
+            self.conn.send(None)
+        except OSError:
+            pass
+        self.process.join(2)
+        self.kill()
+
+    def kill(self):
+        if self.process.is_alive():
+            # Kill the whole group, including any PDF pool workers it started
+            try:
+                os.killpg(self.process.pid, signal.SIGKILL)
+            except (AttributeError, OSError):
+                self.process.kill()
+        self.process.join()
+        self.conn.close()
+
+
+# The one isolation child; extractions take turns on it so the memory budget
+# covers every extraction process on the host, not one per ingestion worker
+_isolation_worker: Optional[_IsolationWorker] = None
+_isolation_lock = threading.Lock()
+
+
+def stop_isolation_worker():
+    """Stop the extraction child (called on shutdown)."""
+    global _isolation_worker
+    with _isolation_lock:
+        if _isolation_worker is not None:
+            _isolation_worker.stop()
+        _isolation_worker = None
+
+
+def _extract_isolated(file_path: str) -> Tuple[List[Dict[str, Any]], int]:
+    """
+    Extract in a child process so a pathological file can be killed on
+    timeout and cannot exhaust the server's memory. The child is reused
+    across documents; one that times out, crashes or runs out of memory
+    is replaced.
+    """
+    global _isolation_worker
+    timeout = settings.extraction_timeout_seconds or None
+    limits = _isolation_limits(settings.extraction_memory_mb)
+    name = Path(file_path).name
+
+    with _isolation_lock:
+        worker = _isolation_worker
+        if worker is None or not worker.alive() or worker.limits != limits:
+            if worker is not None:
+                worker.kill()
+            worker = _isolation_worker = _IsolationWorker(*limits)
+        try:
+            worker.conn.send(file_path)
+            if not worker.conn.poll(timeout):
+                raise ExtractionError(f"Extraction of {name} timed out after {timeout}s")
+            status, payload = worker.conn.recv()
+        except (EOFError, OSError):
+            worker.process.join(5)
+            worker.kill()
+            _isolation_worker = None
+            raise ExtractionError(
+                f"Extraction of {name} crashed (exit code {worker.process.exitcode}); "
+                "the file may be corrupt or exceed the memory limit"
+            )
+        except BaseException:
+            worker.kill()
+            _isolation_worker = None
+            raise
+
+        # A child that hit the memory limit may be left in a bad state; replace it
+        if status == "oom":
+            worker.kill()
+            _isolation_worker = None
+
+    if status != "ok":
+        raise ExtractionError(f"Could not extract {name}: {payload}")
+    return payload
+
+
+class ParsedDocument:
+    """
+    A document parsed exactly once.
+    Carries page count, per-page text and file metadata so the upload
+    handler and the ingestion pipeline never open the same file twice.
+    """
+
+    def __init__(self, file_path: str, pages: List[Dict[str, Any]], page_count: int):
+        ext = Path(file_path).suffix.lower()
+        self.file_path = file_path
+        self.file_type = DocumentProcessor.SUPPORTED_EXTENSIONS.get(ext, "Unknown")
+        self.file_size = os.path.getsize(file_path)
+        self.pages = pages
+        self.page_count = page_count
+
+    @property
+    def metadata(self) -> Dict[str, Any]:
+        return {
+            "file_size": self.file_size,
+            "file_type": self.file_type,
+            "page_count": self.page_count,
+        }
+
 
 class DocumentProcessor:
     """Universal document processor for multiple file types."""
@@ -91,85 +338,115 @@ class DocumentProcessor:
             raise ImportError("beautifulsoup4 is required for HTML support. Install: pip install beautifulsoup4")
     
     @staticmethod
-    def get_metadata(file_path: str) -> Dict[str, Any]:
-        """Get basic metadata from any document."""
-        ext = Path(file_path).suffix.lower()
-        file_size = os.path.getsize(file_path)
-        
-        metadata = {
-            "file_size": file_size,
-            "file_type": DocumentProcessor.SUPPORTED_EXTENSIONS.get(ext, "Unknown"),
-        }
-        
-        # Add page count for PDFs
-        if ext == '.pdf':
-            import PyPDF2
-            with open(file_path, "rb") as file:
-                reader = PyPDF2.PdfReader(file)
-                metadata["page_count"] = len(reader.pages)
+    def parse(file_path: str) -> ParsedDocument:
+        """
+        Parse a document once, returning pages and metadata together.
+        Extraction runs in a child process under the configured wall-clock
+        and memory limits; failures raise ExtractionError.
+        """
+        if settings.extraction_timeout_seconds > 0 or settings.extraction_memory_mb > 0:
+            pages, page_count = _extract_isolated(file_path)
         else:
-            # For non-PDF, estimate pages based on character count
-            text = DocumentProcessor.extract_text(file_path)
-            # Rough estimate: 2000 chars per page
-            metadata["page_count"] = max(1, len(text) // 2000)
+            pages, page_count = DocumentProcessor._extract(file_path)
         
-        return metadata
+        return ParsedDocument(file_path, pages, page_count)
+    
+    @staticmethod
+    def _extract(file_path: str) -> Tuple[List[Dict[str, Any]], int]:
+        """Extract (pages, page_count) with the engine selected for this file type."""
+        ext = Path(file_path).suffix.lower()
+        return get_extractor(ext).extract(file_path)
+    
+    @staticmethod
+    def get_metadata(file_path: str) -> Dict[str, Any]:
+        """Get basic metadata from any document."""
+        return DocumentProcessor.parse(file_path).metadata
     
     @staticmethod
     def extract_pages(file_path: str) -> List[Dict[str, Any]]:
         """Extract content with page/section information."""
-        ext = Path(file_path).suffix.lower()
+        return DocumentProcessor.parse(file_path).pages
+    
+    @staticmethod
+    def _extract_pdf_pages(file_path: str, engine: str = "pypdf2") -> Tuple[List[Dict[str, Any]], int]:
+        """
+        Extract PDF pages, returning (pages with text, total page count).
+        Large PDFs are split into page ranges extracted across a process pool;
+        results are reassembled in page order.
+        """
+        with open(file_path, "rb") as file:
+            reader = _pdf_reader_class(engine)(file)
+            page_count = len(reader.pages)
+            workers = _pdf_worker_count()
+            if workers <= 1 or page_count < settings.pdf_parallel_min_pages:
+                return _extract_reader_pages(reader, 0, page_count), page_count
         
-        if ext == '.pdf':
-            return DocumentProcessor._extract_pdf_pages(file_path)
-        else:
-            # For non-PDF, create virtual pages
-            return DocumentProcessor._extract_virtual_pages(file_path)
+        return DocumentProcessor._extract_pdf_pages_parallel(file_path, page_count, workers, engine), page_count
     
     @staticmethod
-    def _extract_pdf_pages(file_path: str) -> List[Dict[str, Any]]:
-        """Extract PDF pages."""
-        import PyPDF2
+    def _extract_pdf_pages_pymupdf(file_path: str) -> Tuple[List[Dict[str, Any]], int]:
+        """PyMuPDF (MuPDF, native code): much faster than the pure-Python readers."""
+        import pymupdf
         pages = []
-        with open(file_path, "rb") as file:
-            reader = PyPDF2.PdfReader(file)
-            for i, page in enumerate(reader.pages):
-                page_text = page.extract_text()
+        with pymupdf.open(file_path) as doc:
+            for i, page in enumerate(doc):
+                page_text = page.get_text()
                 if page_text:
                     pages.append({
                         "page_number": i + 1,
                         "content": page_text
                     })
-        return pages
+            return pages, doc.page_count
+    
+    @staticmethod
+    def _extract_pdf_pages_parallel(file_path: str, page_count: int, workers: int, engine: str = "pypdf2") -> List[Dict[str, Any]]:
+        """Fan page ranges out across the shared process pool."""
+        # A few ranges per worker keeps the pool busy when page cost is uneven
+        range_size = max(1, -(-page_count // (workers * 4)))
+        ranges = [(start, min(start + range_size, page_count)) for start in range(0, page_count, range_size)]
+        
+        try:
+            pool = _get_pdf_pool()
+            futures = [pool.submit(_extract_pdf_page_range, file_path, start, end, engine) for start, end in ranges]
+            pages = []
+            for future in futures:
+                pages.extend(future.result())
+            return pages
+        except BrokenProcessPool:
+            print(f"⚠️  PDF extraction pool crashed, retrying {file_path} in a single process")
+            _reset_pdf_pool()
+            return _extract_pdf_page_range(file_path, 0, page_count, engine)
+    
+    @staticmethod
+    def _section_builder() -> SectionBuilder:
+        return SectionBuilder(min_chars=settings.chunk_size, max_chars=settings.section_max_chars)
     
     @staticmethod
-    def _extract_virtual_pages(file_path: str) -> List[Dict[str, Any]]:
+    def _as_pages(sections: List[Dict[str, Any]]) -> Tuple[List[Dict[str, Any]], int]:
         """
-        Create virtual pages for non-PDF documents.
-        Split by ~2000 character chunks to simulate pages.
+        Non-PDF formats have no pages: they are split along headings, tables
+        and paragraphs, and each section plays the role of a page. Sections
+        carry offset and, when under a heading, section_title.
         """
-        text = DocumentProcessor.extract_text(file_path)
-        
-        # Split into roughly page-sized chunks
-        page_size = 2000
-        pages = []
-        
-        for i in range(0, len(text), page_size):
-            chunk = text[i:i + page_size]
-            if chunk.strip():
-                pages.append({
-                    "page_number": (i // page_size) + 1,
-                    "content": chunk
-                })
-        
-        # Ensure at least one page
-        if not pages and text.strip():
-            pages.append({
-                "page_number": 1,
-                "content": text
-            })
-        
-        return pages
+        return sections, max(1, len(sections))
+    
+    @staticmethod
+    def _extract_docx_sections(file_path: str) -> Tuple[List[Dict[str, Any]], int]:
+        return DocumentProcessor._as_pages(docx_sections(file_path, DocumentProcessor._section_builder()))
+    
+    @staticmethod
+    def _extract_html_sections(file_path: str, parser: str = "html.parser") -> Tuple[List[Dict[str, Any]], int]:
+        return DocumentProcessor._as_pages(html_sections(file_path, DocumentProcessor._section_builder(), parser))
+    
+    @staticmethod
+    def _extract_markdown_sections(file_path: str) -> Tuple[List[Dict[str, Any]], int]:
+        text = DocumentProcessor._extract_text_file(file_path)
+        return DocumentProcessor._as_pages(markdown_sections(text, DocumentProcessor._section_builder()))
+    
+    @staticmethod
+    def _extract_text_sections(file_path: str) -> Tuple[List[Dict[str, Any]], int]:
+        text = DocumentProcessor._extract_text_file(file_path)
+        return DocumentProcessor._as_pages(text_sections(text, DocumentProcessor._section_builder()))
     
     @staticmethod
     def chunk_text(text: str, chunk_size: int = 500, chunk_overlap: int = 50) -> List[str]:
@@ -180,3 +457,15 @@ class DocumentProcessor:
             separators=["\n\n", "\n", ". ", " ", ""]
         )
         return splitter.split_text(text)
+
+
+# Extraction engines, fastest first within each format ("auto" picks the
+# first installed one; PDF_ENGINE / HTML_PARSER select one explicitly)
+register_extractor([".pdf"], "pymupdf", DocumentProcessor._extract_pdf_pages_pymupdf, requires="pymupdf")
+register_extractor([".pdf"], "pypdf", partial(DocumentProcessor._extract_pdf_pages, engine="pypdf"), requires="pypdf")
+register_extractor([".pdf"], "pypdf2", DocumentProcessor._extract_pdf_pages, requires="PyPDF2")
+register_extractor([".html", ".htm"], "lxml", partial(DocumentProcessor._extract_html_sections, parser="lxml"), requires="lxml")
+register_extractor([".html", ".htm"], "html.parser", DocumentProcessor._extract_html_sections, requires="bs4")
+register_extractor([".docx", ".doc"], "python-docx", DocumentProcessor._extract_docx_sections, requires="docx")
+register_extractor([".md"], "markdown", DocumentProcessor._extract_markdown_sections)
+register_extractor([".txt"], "text", DocumentProcessor._extract_text_sections)
@@ -0,0 +1,192 @@
+"""
+Embedding Batcher for ChatPDF
+Merges embedding requests across pages and concurrent documents into
+maximum-size batches, keeps several requests in flight and adapts
+concurrency to observed rate limiting and latency (AIMD).
+"""
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Callable, Deque, Dict, List, Tuple
+import threading
+import time
+
+
+def is_rate_limit_error(error: Exception) -> bool:
+    """True if the upstream API rejected the call because of rate limiting."""
+    code = getattr(error, "code", None) or getattr(error, "status_code", None)
+    if code == 429:
+        return True
+    message = str(error)
+    return "429" in message or "RESOURCE_EXHAUSTED" in message
+
+
+class EmbeddingBatcher:
+    """
+    Shared embedding scheduler.
+
+    Callers submit any number of texts and block until their vectors are ready.
+    A dispatcher thread drains the pending queue into batches of up to
+    `max_batch_size` and runs up to `in_flight_limit` batches concurrently.
+    On 429 the limit is halved and dispatch backs off; each successful batch
+    grows it additively again, unless latency has degraded.
+    """
+
+    def __init__(
+        self,
+        embed_fn: Callable[[List[str], str], List[List[float]]],
+        max_batch_size: int = 100,
+        max_in_flight: int = 4,
+        linger_ms: int = 20,
+        max_retries: int = 6
+    ):
+        self.embed_fn = embed_fn
+        self.max_batch_size = max_batch_size
+        self.max_in_flight = max(1, max_in_flight)
+        self.linger = linger_ms / 1000
+        self.max_retries = max_retries
+
+        self._pending: Dict[str, Deque[Tuple[str, Future, int]]] = {}
+        self._cond = threading.Condition()
+        self._executor = ThreadPoolExecutor(max_workers=self.max_in_flight, thread_name_prefix="embed")
+        self._dispatcher = None
+
+        # Adaptive rate control
+        self._in_flight = 0
+        self._limit = float(self.max_in_flight)
+        self._backoff = 0.0
+        self._backoff_until = 0.0
+        self._latency_baseline = None
+        self._latency_ewma = None
+
+        # Counters
+        self._batches = 0
+        self._items = 0
+        self._throttle_events = 0
+        self._errors = 0
+        self._recent: Deque[Tuple[float, int]] = deque()
+
+    def embed(self, texts: List[str], task_type: str = "retrieval_document") -> List[List[float]]:
+        """Embed texts through the shared scheduler, blocking until all are done."""
+        if not texts:
+            return []
+        futures = [Future() for _ in texts]
+        with self._cond:
+            self._ensure_dispatcher()
+            pending = self._pending.setdefault(task_type, deque())
+            for text, future in zip(texts, futures):
+                pending.append((text, future, 0))
+            self._cond.notify_all()
+        return [future.result() for future in futures]
+
+    def stats(self) -> Dict[str, float]:
+        """Counters for monitoring: batches, items/sec, throttle events."""
+        with self._cond:
+            now = time.monotonic()
+            self._trim_recent(now)
+            recent_items = sum(n for _, n in self._recent)
+            return {
+                "batches": self._batches,
+                "items": self._items,
+                "avg_batch_size": round(self._items / self._batches, 2) if self._batches else 0.0,
+                "items_per_sec": round(recent_items / 60, 2),
+                "throttle_events": self._throttle_events,
+                "errors": self._errors,
+                "in_flight": self._in_flight,
+                "in_flight_limit": round(self._limit, 2),
+                "queued": sum(len(q) for q in self._pending.values()),
+                "latency_ms": round(self._latency_ewma * 1000, 1) if self._latency_ewma else None,
+            }
+
+    def _ensure_dispatcher(self):
+        if self._dispatcher is None or not self._dispatcher.is_alive():
+            self._dispatcher = threading.Thread(target=self._dispatch_loop, name="embed-dispatcher", daemon=True)
+            self._dispatcher.start()
+
+    def _queued(self) -> int:
+        return sum(len(q) for q in self._pending.values())
+
+    def _trim_recent(self, now: float):
+        while self._recent and now - self._recent[0][0] > 60:
+            self._recent.popleft()
+
+    def _dispatch_loop(self):
+        while True:
+            with self._cond:
+                while True:
+                    now = time.monotonic()
+                    if self._queued() == 0:
+                        self._cond.wait()
+                    elif now < self._backoff_until:
+                        self._cond.wait(self._backoff_until - now)
+                    elif self._in_flight >= int(self._limit):
+                        self._cond.wait()
+                    else:
+                        break
+
+                task_type, queue = max(self._pending.items(), key=lambda item: len(item[1]))
+                # Give other pages/documents a moment to fill a partial batch
+                if len(queue) < self.max_batch_size and self.linger > 0:
+                    self._cond.wait(self.linger)
+
+                batch = []
+                while queue and len(batch) < self.max_batch_size:
+                    batch.append(queue.popleft())
+                if not batch:
+                    continue
+                self._in_flight += 1
+
+            self._executor.submit(self._run_batch, task_type, batch)
+
+    def _run_batch(self, task_type: str, batch: List[Tuple[str, Future, int]]):
+        started = time.monotonic()
+        try:
+            vectors = self.embed_fn([text for text, _, _ in batch], task_type)
+            if len(vectors) != len(batch):
+                raise ValueError(f"Expected {len(batch)} embeddings, got {len(vectors)}")
+        except Exception as e:
+            self._on_failure(task_type, batch, e)
+            return
+
+        latency = time.monotonic() - started
+        for (_, future, _), vector in zip(batch, vectors):
+            future.set_result(vector)
+
+        with self._cond:
+            self._in_flight -= 1
+            self._batches += 1
+            self._items += len(batch)
+            now = time.monotonic()
+            self._recent.append((now, len(batch)))
+            self._trim_recent(now)
+            self._backoff = 0.0
+
+            self._latency_ewma = latency if self._latency_ewma is None else 0.8 * self._latency_ewma + 0.2 * latency
+            if self._latency_baseline is None or latency < self._latency_baseline:
+                self._latency_baseline = latency
+            if self._latency_ewma > 3 * self._latency_baseline:
+                # Upstream is slowing down: ease off before it starts rejecting us
+                self._limit = max(1.0, self._limit * 0.75)
+            else:
+                self._limit = min(float(self.max_in_flight), self._limit + 1.0 / self._limit)
+            self._cond.notify_all()
+
+    def _on_failure(self, task_type: str, batch: List[Tuple[str, Future, int]], error: Exception):
+        with self._cond:
+            self._in_flight -= 1
+            if is_rate_limit_error(error):
+                self._throttle_events += 1
+                self._limit = max(1.0, self._limit / 2)
+                self._backoff = min(30.0, self._backoff * 2 if self._backoff else 1.0)
+                self._backoff_until = time.monotonic() + self._backoff
+
+                retry = [(text, future, attempt + 1) for text, future, attempt in batch if attempt < self.max_retries]
+                failed = [future for _, future, attempt in batch if attempt >= self.max_retries]
+                queue = self._pending.setdefault(task_type, deque())
+                queue.extendleft(reversed(retry))
+            else:
+                self._errors += 1
+                failed = [future for _, future, _ in batch]
+            self._cond.notify_all()
+
+        for future in failed:
+            future.set_exception(error)
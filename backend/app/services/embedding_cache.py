@@ -0,0 +1,156 @@
+"""
+Persistent Embedding Cache for ChatPDF
+On-disk cache keyed by (text hash, model, task type) with compact float32
+storage, least-recently-used eviction by total size, and hit-rate metrics.
+"""
+from array import array
+from pathlib import Path
+from typing import Dict, List, Optional
+import hashlib
+import sqlite3
+import threading
+import time
+
+
+class EmbeddingCache:
+    """SQLite-backed embedding cache. Safe to share between threads."""
+
+    def __init__(self, path: str, max_bytes: int):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.max_bytes = max_bytes
+
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(str(self.path), check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS embeddings (
+                text_hash TEXT NOT NULL,
+                model TEXT NOT NULL,
+                task_type TEXT NOT NULL,
+                vector BLOB NOT NULL,
+                size INTEGER NOT NULL,
+                last_access REAL NOT NULL,
+                PRIMARY KEY (text_hash, model, task_type)
+            )
+        """)
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_embeddings_last_access ON embeddings(last_access)")
+        self._conn.commit()
+
+        row = self._conn.execute("SELECT COALESCE(SUM(size), 0), COUNT(*) FROM embeddings").fetchone()
+        self._total_bytes = row[0]
+        self._entries = row[1]
+
+        self._hits = 0
+        self._misses = 0
+        self._evictions = 0
+
+    @staticmethod
+    def _hash(text: str) -> str:
+        return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+    def get_many(self, texts: List[str], model: str, task_type: str) -> List[Optional[List[float]]]:
+        """Look up vectors for texts; missing entries are returned as None."""
+        if not texts:
+            return []
+        hashes = [self._hash(text) for text in texts]
+        found: Dict[str, List[float]] = {}
+        now = time.time()
+
+        with self._lock:
+            unique = list(dict.fromkeys(hashes))
+            # Stay well below SQLite's bound-parameter limit
+            for i in range(0, len(unique), 500):
+                part = unique[i:i + 500]
+                placeholders = ",".join("?" * len(part))
+                rows = self._conn.execute(
+                    f"SELECT text_hash, vector FROM embeddings "
+                    f"WHERE model = ? AND task_type = ? AND text_hash IN ({placeholders})",
+                    [model, task_type, *part]
+                ).fetchall()
+                for text_hash, blob in rows:
+                    found[text_hash] = array("f", blob).tolist()
+
+            if found:
+                self._conn.executemany(
+                    "UPDATE embeddings SET last_access = ? WHERE text_hash = ? AND model = ? AND task_type = ?",
+                    [(now, text_hash, model, task_type) for text_hash in found]
+                )
+                self._conn.commit()
+
+            results = [found.get(text_hash) for text_hash in hashes]
+            hits = sum(1 for r in results if r is not None)
+            self._hits += hits
+            self._misses += len(results) - hits
+        return results
+
+    def put_many(self, texts: List[str], vectors: List[List[float]], model: str, task_type: str):
+        """Store vectors for texts. All-zero fallback vectors are never cached."""
+        now = time.time()
+        # Keyed by text hash: a text repeated within the batch is stored (and
+        # counted) once, the last vector winning as INSERT OR REPLACE would
+        by_key = {}
+        for text, vector in zip(texts, vectors):
+            if not vector or not any(vector):
+                continue
+            blob = array("f", vector).tobytes()
+            text_hash = self._hash(text)
+            by_key[text_hash] = (text_hash, model, task_type, blob, len(blob), now)
+        rows = list(by_key.values())
+        if not rows:
+            return
+
+        with self._lock:
+            for text_hash, row_model, row_task, _, size, _ in rows:
+                existing = self._conn.execute(
+                    "SELECT size FROM embeddings WHERE text_hash = ? AND model = ? AND task_type = ?",
+                    (text_hash, row_model, row_task)
+                ).fetchone()
+                if existing:
+                    self._total_bytes -= existing[0]
+                    self._entries -= 1
+                self._total_bytes += size
+                self._entries += 1
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO embeddings (text_hash, model, task_type, vector, size, last_access) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                rows
+            )
+            self._conn.commit()
+            if self._total_bytes > self.max_bytes:
+                self._evict()
+
+    def _evict(self):
+        """Drop least recently used entries until the cache is back under 90% of its budget."""
+        target = int(self.max_bytes * 0.9)
+        while self._total_bytes > target and self._entries > 0:
+            rows = self._conn.execute(
+                "SELECT rowid, size FROM embeddings ORDER BY last_access ASC LIMIT 500"
+            ).fetchall()
+            if not rows:
+                break
+            evict = []
+            for rowid, size in rows:
+                evict.append((rowid,))
+                self._total_bytes -= size
+                self._entries -= 1
+                if self._total_bytes <= target:
+                    break
+            self._conn.executemany("DELETE FROM embeddings WHERE rowid = ?", evict)
+            self._evictions += len(evict)
+        self._conn.commit()
+
+    def stats(self) -> Dict[str, float]:
+        """Hit-rate and size metrics."""
+        with self._lock:
+            lookups = self._hits + self._misses
+            return {
+                "hits": self._hits,
+                "misses": self._misses,
+                "hit_rate": round(self._hits / lookups, 4) if lookups else 0.0,
+                "entries": self._entries,
+                "size_mb": round(self._total_bytes / (1024 * 1024), 2),
+                "max_size_mb": round(self.max_bytes / (1024 * 1024), 2),
+                "evictions": self._evictions,
+            }
@@ -1,16 +1,44 @@
 from google import genai
 from google.genai import types
+import asyncio
+import math
 import os
-import time
 from typing import List, Union
 from dotenv import load_dotenv
 from ..config import settings
+from .embedding_batcher import EmbeddingBatcher
+from .embedding_cache import EmbeddingCache
+from .query_coalescer import QueryEmbeddingCoalescer
 
 load_dotenv()
 
+# Native output size of the embedding model
+FULL_DIMENSIONS = 768
+# Model used before the embedding model became configurable
+DEFAULT_EMBEDDING_MODEL = "models/text-embedding-004"
+
+_shared_cache = None
+
+
+def get_embedding_cache():
+    """One cache connection shared by every EmbeddingService (entries are keyed per model)."""
+    global _shared_cache
+    if _shared_cache is None and settings.embedding_cache_enabled:
+        _shared_cache = EmbeddingCache(
+            settings.embedding_cache_path,
+            max_bytes=settings.embedding_cache_max_mb * 1024 * 1024
+        )
+    return _shared_cache
+
+
+def normalize(vector: List[float]) -> List[float]:
+    """Scale a vector to unit length (truncated Matryoshka outputs are not normalized)."""
+    norm = math.sqrt(sum(v * v for v in vector))
+    return [v / norm for v in vector] if norm else list(vector)
+
 
 class EmbeddingService:
-    def __init__(self):
+    def __init__(self, model_name: str = None, dimensions: int = None):
         # Initialize the new GenAI Client
         if not settings.gemini_api_key:
              # Fallback to os.getenv if settings not ready (though settings should handle it)
@@ -18,60 +46,180 @@ class EmbeddingService:
         else:
              self.client = genai.Client(api_key=settings.gemini_api_key)
              
-        self.model_name = "models/text-embedding-004" # Using newer persistent model if available, or embedding-001
-        print(f"Initialized Gemini Embedding Service (google.genai) with {self.model_name}")
+        self.model_name = model_name or settings.embedding_model
+        # Matryoshka-style output size; shorter vectors are re-normalized for cosine
+        self.dimensions = dimensions or settings.embedding_dimensions
+        # Cache entries are only valid for the same model and output size
+        self.cache_model_key = self.model_name if self.dimensions == FULL_DIMENSIONS else f"{self.model_name}@{self.dimensions}"
+        print(f"Initialized Gemini Embedding Service (google.genai) with {self.model_name} ({self.dimensions}d)")
+        
+        # Shared scheduler that merges chunk batches across pages and documents
+        self.batcher = EmbeddingBatcher(
+            self._embed_batch,
+            max_batch_size=settings.embedding_batch_size,
+            max_in_flight=settings.embedding_max_in_flight,
+            linger_ms=settings.embedding_batch_linger_ms
+        )
+        
+        # Persistent cache so re-indexing and duplicate text never pay twice
+        self.cache = get_embedding_cache()
+        
+        # Async path: client.aio reuses one HTTP connection pool; the semaphore
+        # caps concurrent upstream calls and is created on first use per loop
+        self._async_semaphore = None
+        self._async_loop = None
+        
+        # Concurrent single-text (query) embeddings share batched upstream calls
+        self.query_coalescer = QueryEmbeddingCoalescer(
+            self._aembed_batch,
+            window_ms=settings.query_embed_window_ms,
+            max_batch=settings.query_embed_max_batch
+        )
+
+    @property
+    def profile(self) -> dict:
+        """Model and output size; vectors are only comparable within one profile."""
+        return {"model": self.model_name, "dimensions": self.dimensions}
+
+    def _embed_config(self, task_type: str) -> types.EmbedContentConfig:
+        return types.EmbedContentConfig(
+            task_type=task_type,
+            output_dimensionality=self.dimensions
+        )
 
     def embed_text(self, text: str, task_type: str = "retrieval_query") -> List[float]:
         """Embed a single string (query or document)."""
+        if self.cache:
+            cached = self.cache.get_many([text], self.cache_model_key, task_type)[0]
+            if cached is not None:
+                return cached
         try:
             # New SDK usage
             response = self.client.models.embed_content(
                 model=self.model_name,
                 contents=text,
-                config=types.EmbedContentConfig(
-                    task_type=task_type
-                )
+                config=self._embed_config(task_type)
             )
-            return response.embeddings[0].values
+            vector = normalize(response.embeddings[0].values)
+            if self.cache:
+                self.cache.put_many([text], [vector], self.cache_model_key, task_type)
+            return vector
         except Exception as e:
             print(f"Error embedding text: {e}")
-            return [0.0] * 768
+            return [0.0] * self.dimensions
+
+    def _embed_batch(self, texts: List[str], task_type: str) -> List[List[float]]:
+        """Single upstream batch call. Raises on failure so the batcher can react."""
+        response = self.client.models.embed_content(
+            model=self.model_name,
+            contents=texts,
+            config=self._embed_config(task_type)
+        )
+        # New SDK returns a list of embedding objects
+        return [normalize(emb.values) for emb in (response.embeddings or [])]
 
     def embed_chunks(self, chunks: List[str]) -> List[List[float]]:
-        """Batch embed multiple strings (documents)."""
-        embeddings = []
-        batch_size = 10
+        """Batch embed multiple strings (documents) via the cache and shared batcher."""
+        task_type = "retrieval_document"
+        if self.cache:
+            embeddings = self.cache.get_many(chunks, self.cache_model_key, task_type)
+        else:
+            embeddings = [None] * len(chunks)
+        
+        missing = [i for i, emb in enumerate(embeddings) if emb is None]
+        if not missing:
+            return embeddings
+        
+        texts = [chunks[i] for i in missing]
+        try:
+            computed = self.batcher.embed(texts, task_type=task_type)
+            if self.cache:
+                self.cache.put_many(texts, computed, self.cache_model_key, task_type)
+        except Exception as e:
+            print(f"Error batch embedding: {e}")
+            # Fallback: one by one
+            computed = [self.embed_text(text, task_type=task_type) for text in texts]
         
-        for i in range(0, len(chunks), batch_size):
-            batch = chunks[i:i + batch_size]
+        for i, emb in zip(missing, computed):
+            embeddings[i] = emb
+        return embeddings
+
+    def _get_async_semaphore(self) -> asyncio.Semaphore:
+        loop = asyncio.get_running_loop()
+        if self._async_semaphore is None or self._async_loop is not loop:
+            self._async_semaphore = asyncio.Semaphore(settings.embedding_async_concurrency)
+            self._async_loop = loop
+        return self._async_semaphore
+
+    async def _aembed_batch(self, texts: List[str], task_type: str) -> List[List[float]]:
+        """Single non-blocking upstream batch call. Raises on failure."""
+        async with self._get_async_semaphore():
+            response = await self.client.aio.models.embed_content(
+                model=self.model_name,
+                contents=texts,
+                config=self._embed_config(task_type)
+            )
+        return [normalize(emb.values) for emb in (response.embeddings or [])]
+
+    async def aembed_text(self, text: str, task_type: str = "retrieval_query") -> List[float]:
+        """Embed a single string without blocking the event loop."""
+        # The SQLite cache takes a lock ingestion threads can hold for a while,
+        # so it is only ever touched from a worker thread here
+        if self.cache:
+            cached = (await asyncio.to_thread(self.cache.get_many, [text], self.cache_model_key, task_type))[0]
+            if cached is not None:
+                return cached
+        try:
+            if settings.query_embed_window_ms > 0:
+                vector = await self.query_coalescer.embed(text, task_type)
+            else:
+                vector = (await self._aembed_batch([text], task_type))[0]
+            if self.cache:
+                await asyncio.to_thread(self.cache.put_many, [text], [vector], self.cache_model_key, task_type)
+            return vector
+        except Exception as e:
+            print(f"Error embedding text: {e}")
+            return [0.0] * self.dimensions
+
+    async def aembed_chunks(self, chunks: List[str], task_type: str = "retrieval_document") -> List[List[float]]:
+        """Batch embed multiple strings concurrently without blocking the event loop."""
+        if self.cache:
+            embeddings = await asyncio.to_thread(self.cache.get_many, chunks, self.cache_model_key, task_type)
+        else:
+            embeddings = [None] * len(chunks)
+        
+        missing = [i for i, emb in enumerate(embeddings) if emb is None]
+        if not missing:
+            return embeddings
+        
+        async def embed_part(texts: List[str]) -> List[List[float]]:
             try:
-                response = self.client.models.embed_content(
-                    model=self.model_name,
-                    contents=batch,
-                    config=types.EmbedContentConfig(
-                        task_type="retrieval_document"
-                    )
-                )
-                
-                # New SDK returns a list of embedding objects
-                if response.embeddings:
-                    batch_embeddings = [emb.values for emb in response.embeddings]
-                    embeddings.extend(batch_embeddings)
-                    
-                time.sleep(0.5)
-                
+                vectors = await self._aembed_batch(texts, task_type)
+                if len(vectors) != len(texts):
+                    raise ValueError(f"Expected {len(texts)} embeddings, got {len(vectors)}")
+                if self.cache:
+                    await asyncio.to_thread(self.cache.put_many, texts, vectors, self.cache_model_key, task_type)
+                return vectors
             except Exception as e:
                 print(f"Error batch embedding: {e}")
-                # Fallback: one by one
-                for text in batch:
-                    try:
-                        embeddings.append(self.embed_text(text, task_type="retrieval_document"))
-                        time.sleep(0.2) 
-                    except:
-                        embeddings.append([0.0] * 768)
-                        
+                return [await self.aembed_text(text, task_type=task_type) for text in texts]
+        
+        texts = [chunks[i] for i in missing]
+        size = settings.embedding_batch_size
+        parts = await asyncio.gather(*(embed_part(texts[i:i + size]) for i in range(0, len(texts), size)))
+        
+        computed = [vector for part in parts for vector in part]
+        for i, emb in zip(missing, computed):
+            embeddings[i] = emb
         return embeddings
 
+    def get_stats(self) -> dict:
+        """Embedding throughput, throttling and cache counters."""
+        stats = self.batcher.stats()
+        stats["cache"] = self.cache.stats() if self.cache else None
+        stats["query_coalescer"] = self.query_coalescer.stats()
+        return stats
+
 # Singleton instance
 embedding_service = EmbeddingService()
 
@@ -0,0 +1,80 @@
+"""
+Extractor Registry for ChatPDF
+Maps file extensions to the extraction engines that can read them, in order
+of preference. `settings.pdf_engine` / `settings.html_parser` pick an engine
+explicitly; "auto" uses the fastest one installed, falling back to the
+pure-Python defaults.
+"""
+from typing import Any, Callable, Dict, List, Optional, Tuple
+import importlib.util
+
+from ..config import settings
+
+# An extractor returns (pages, page_count); pages are dicts with at least
+# "page_number" and "content"
+ExtractFn = Callable[[str], Tuple[List[Dict[str, Any]], int]]
+
+
+class ExtractionError(Exception):
+    """A document could not be extracted (bad file, timeout or memory limit)."""
+
+
+class Extractor:
+    def __init__(self, name: str, extract: ExtractFn, requires: Optional[str] = None):
+        self.name = name
+        self.extract = extract
+        # Module that must be importable for this engine
+        self.requires = requires
+
+    @property
+    def available(self) -> bool:
+        return self.requires is None or importlib.util.find_spec(self.requires) is not None
+
+
+_registry: Dict[str, List[Extractor]] = {}
+
+# Which setting chooses the engine for an extension
+_ENGINE_SETTINGS = {
+    ".pdf": "pdf_engine",
+    ".html": "html_parser",
+    ".htm": "html_parser",
+}
+
+
+def register_extractor(extensions: List[str], name: str, extract: ExtractFn, requires: Optional[str] = None):
+    """Register an engine; engines registered first are preferred under "auto"."""
+    extractor = Extractor(name, extract, requires)
+    for ext in extensions:
+        _registry.setdefault(ext, []).append(extractor)
+
+
+def get_extractor(ext: str) -> Extractor:
+    """Select the engine for a file extension according to settings."""
+    candidates = _registry.get(ext)
+    if not candidates:
+        raise ValueError(f"Unsupported file type: {ext}")
+
+    setting = _ENGINE_SETTINGS.get(ext)
+    requested = getattr(settings, setting, "auto").lower() if setting else "auto"
+    if requested != "auto":
+        for extractor in candidates:
+            if extractor.name == requested:
+                if extractor.available:
+                    return extractor
+                print(f"⚠️  Extraction engine '{requested}' is not installed, falling back")
+                break
+        else:
+            print(f"⚠️  Unknown extraction engine '{requested}' for {ext}, falling back")
+
+    for extractor in candidates:
+        if extractor.available:
+            return extractor
+    raise ExtractionError(f"No extraction engine installed for {ext} files")
+
+
+def list_engines() -> Dict[str, List[Dict[str, Any]]]:
+    """Registered engines per extension and whether each is installed."""
+    return {
+        ext: [{"name": e.name, "available": e.available} for e in extractors]
+        for ext, extractors in _registry.items()
+    }
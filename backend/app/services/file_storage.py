@@ -0,0 +1,76 @@
+"""
+Upload Storage for ChatPDF
+Streams uploaded files to disk in bounded chunks while hashing them
+"""
+import hashlib
+import os
+from pathlib import Path
+from typing import Dict, Any
+
+from fastapi import UploadFile
+
+from ..config import settings
+
+
+class FileTooLargeError(Exception):
+    """Raised when an upload exceeds the configured size limit."""
+
+    def __init__(self, max_size: int):
+        self.max_size = max_size
+        super().__init__(f"File size exceeds {max_size // (1024 * 1024)}MB limit")
+
+
+async def save_upload_file(
+    file: UploadFile,
+    destination: Path,
+    max_size: int,
+    chunk_size: int = None
+) -> Dict[str, Any]:
+    """
+    Write an upload to disk incrementally, enforcing the size limit as bytes arrive.
+
+    Only one buffer of `chunk_size` bytes is held in memory at a time. The
+    SHA-256 digest and byte count are computed in the same pass so callers
+    never need to re-read the file.
+
+    Args:
+        file: Incoming FastAPI upload
+        destination: Path to write the file to
+        max_size: Maximum allowed size in bytes
+        chunk_size: Read buffer size (defaults to settings.upload_chunk_size)
+
+    Returns:
+        dict: {"file_size": int, "sha256": str}
+
+    Raises:
+        FileTooLargeError: If the upload exceeds max_size (partial file is removed)
+    """
+    chunk_size = chunk_size or settings.upload_chunk_size
+
+    # Reject early when the client told us the size up front
+    if file.size is not None and file.size > max_size:
+        raise FileTooLargeError(max_size)
+
+    digest = hashlib.sha256()
+    total = 0
+
+    try:
+        with open(destination, "wb") as out:
+            while True:
+                chunk = await file.read(chunk_size)
+                if not chunk:
+                    break
+                total += len(chunk)
+                if total > max_size:
+                    raise FileTooLargeError(max_size)
+                digest.update(chunk)
+                out.write(chunk)
+    except BaseException:
+        if os.path.exists(destination):
+            os.remove(destination)
+        raise
+
+    return {
+        "file_size": total,
+        "sha256": digest.hexdigest()
+    }
@@ -0,0 +1,197 @@
+"""
+Ingestion Job Queue for ChatPDF
+Persists document processing jobs and runs them on a bounded worker pool
+off the event loop. Interrupted jobs are resumed on startup.
+"""
+from datetime import datetime
+from typing import Optional
+import queue
+import threading
+
+from sqlalchemy.orm import Session
+
+from .. import models
+from ..config import settings
+from ..database import SessionLocal
+from .document_processor import DocumentProcessor
+from .vector_store import vector_store
+
+
+# Job states
+JOB_QUEUED = "queued"
+JOB_EXTRACTING = "extracting"
+JOB_EMBEDDING = "embedding"
+JOB_INDEXING = "indexing"
+JOB_DONE = "done"
+JOB_FAILED = "failed"
+
+FINISHED_STATES = (JOB_DONE, JOB_FAILED)
+
+
+def _set_state(db: Session, job: models.IngestionJob, state: str, error: Optional[str] = None):
+    job.state = state
+    job.error = error
+    if state in FINISHED_STATES:
+        job.finished_at = datetime.utcnow()
+    db.commit()
+
+
+def process_document(db: Session, job: models.IngestionJob, doc: models.Document):
+    """Run the extraction → embedding → indexing pipeline for one document."""
+    doc_id = doc.id
+
+    # 1. Parse once: pages/sections plus metadata
+    _set_state(db, job, JOB_EXTRACTING)
+    parsed = DocumentProcessor.parse(doc.file_path)
+    doc_data = parsed.pages
+
+    all_chunks = []
+    all_metadatas = []
+
+    # 2. Chunk every page/section, then embed the whole document in one
+    #    submission so the batcher can build full-size batches
+    for page in doc_data:
+        chunks = DocumentProcessor.chunk_text(page["content"], settings.chunk_size, settings.chunk_overlap)
+        cursor = 0
+        for i, chunk in enumerate(chunks):
+            meta = {
+                "document_id": doc_id,
+                "filename": doc.original_filename,
+                "page": page["page_number"],
+                "chunk_index": i,
+                # Document-ordered position; also the chunk ID suffix
+                "position": len(all_chunks)
+            }
+            # Sections (non-PDF formats) carry their heading path and offset
+            if page.get("section_title"):
+                meta["section_title"] = page["section_title"]
+            if "offset" in page:
+                found = page["content"].find(chunk, cursor)
+                if found >= 0:
+                    cursor = found + 1
+                    meta["offset"] = page["offset"] + found
+            all_metadatas.append(meta)
+            all_chunks.append(chunk)
+
+    _set_state(db, job, JOB_EMBEDDING)
+    # Embed with the active collection's profile (differs from the
+    # configured one while a re-embedding rebuild is in progress)
+    embedder = vector_store.embedder
+    all_embeddings = embedder.embed_chunks(all_chunks) if all_chunks else []
+
+    # 3. Store in Vector DB
+    _set_state(db, job, JOB_INDEXING)
+    if all_chunks:
+        vector_store.add_chunks(doc_id, all_chunks, all_embeddings, all_metadatas, embedder=embedder)
+
+    # 4. Update Database
+    doc.page_count = parsed.page_count
+    doc.processed = True
+    doc.processing_error = None
+    doc.chunk_count = len(all_chunks)
+    _set_state(db, job, JOB_DONE)
+
+
+class IngestionQueue:
+    """
+    Durable document ingestion queue.
+
+    Jobs are rows in `ingestion_jobs`; the in-memory queue only carries job IDs.
+    A fixed number of worker threads run the synchronous pipeline so the
+    event loop (and every in-flight chat stream) is never blocked.
+    """
+
+    def __init__(self, concurrency: int = 2, max_attempts: int = 3):
+        self.concurrency = max(1, concurrency)
+        self.max_attempts = max_attempts
+        self._queue: "queue.Queue[Optional[str]]" = queue.Queue()
+        self._workers = []
+
+    def start(self):
+        """Start worker threads and re-queue jobs interrupted by a restart."""
+        if self._workers:
+            return
+        resumed = self._recover()
+        for i in range(self.concurrency):
+            worker = threading.Thread(target=self._worker_loop, name=f"ingestion-{i}", daemon=True)
+            worker.start()
+            self._workers.append(worker)
+        print(f"✅ Ingestion workers started ({self.concurrency} workers, {resumed} jobs resumed)")
+
+    def stop(self, timeout: float = 5.0):
+        """Signal workers to exit; unfinished jobs stay in the table and resume on next start."""
+        for _ in self._workers:
+            self._queue.put(None)
+        for worker in self._workers:
+            worker.join(timeout=timeout)
+        self._workers = []
+
+    def enqueue(self, db: Session, doc_id: str) -> models.IngestionJob:
+        """Persist a job for a document and hand it to the workers."""
+        job = models.IngestionJob(document_id=doc_id, state=JOB_QUEUED)
+        db.add(job)
+        db.commit()
+        self._queue.put(job.id)
+        return job
+
+    def _recover(self) -> int:
+        db = SessionLocal()
+        try:
+            jobs = db.query(models.IngestionJob).filter(
+                models.IngestionJob.state.notin_(FINISHED_STATES)
+            ).order_by(models.IngestionJob.created_at.asc()).all()
+            for job in jobs:
+                job.state = JOB_QUEUED
+            db.commit()
+            for job in jobs:
+                self._queue.put(job.id)
+            return len(jobs)
+        finally:
+            db.close()
+
+    def _worker_loop(self):
+        while True:
+            job_id = self._queue.get()
+            if job_id is None:
+                return
+            try:
+                self._run_job(job_id)
+            except Exception as e:
+                print(f"❌ Ingestion worker error for job {job_id}: {e}")
+
+    def _run_job(self, job_id: str):
+        db = SessionLocal()
+        try:
+            job = db.query(models.IngestionJob).filter(models.IngestionJob.id == job_id).first()
+            if not job or job.state in FINISHED_STATES:
+                return
+
+            doc = db.query(models.Document).filter(models.Document.id == job.document_id).first()
+            if not doc:
+                _set_state(db, job, JOB_FAILED, "Document no longer exists")
+                return
+
+            job.attempts += 1
+            job.started_at = datetime.utcnow()
+            if job.attempts > self.max_attempts:
+                doc.processing_error = f"Giving up after {self.max_attempts} attempts"
+                _set_state(db, job, JOB_FAILED, doc.processing_error)
+                return
+            db.commit()
+
+            try:
+                process_document(db, job, doc)
+            except Exception as e:
+                print(f"Error processing document {doc.id}: {str(e)}")
+                db.rollback()
+                doc.processing_error = str(e)
+                _set_state(db, job, JOB_FAILED, str(e))
+        finally:
+            db.close()
+
+
+# Singleton instance
+ingestion_queue = IngestionQueue(
+    concurrency=settings.ingestion_workers,
+    max_attempts=settings.ingestion_max_attempts
+)
@@ -0,0 +1,195 @@
+"""
+Lexical Index for ChatPDF
+SQLite FTS5 inverted index over chunk text with BM25 ranking. Catches exact
+identifiers, part numbers and quoted phrases that dense retrieval misses,
+and answers retrieval without any embedding call in lexical-only mode.
+"""
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, Optional, Set
+import json
+import re
+import sqlite3
+import threading
+
+# Words too common to help ranking; dropped from queries only
+STOPWORDS = {
+    "a", "an", "and", "are", "as", "at", "be", "by", "can", "do", "does", "for",
+    "from", "how", "i", "in", "is", "it", "me", "of", "on", "or", "tell", "that",
+    "the", "this", "to", "was", "what", "when", "where", "which", "who", "why",
+    "with", "you", "about", "there", "their", "they", "we", "my", "your"
+}
+
+# Constant from the original RRF paper; damps the influence of top ranks
+RRF_K = 60
+
+
+def build_match_query(question: str) -> Optional[str]:
+    """
+    Turn free text into an FTS5 MATCH expression.
+
+    Quoted phrases stay phrases; terms with inner punctuation (part numbers
+    like "AB-1234", versions like "2.0.1") become phrases of their parts so
+    the pieces must appear adjacently; remaining words are OR-ed.
+    """
+    clauses = []
+    for phrase in re.findall(r'"([^"]+)"', question):
+        tokens = re.findall(r"\w+", phrase.lower())
+        if tokens:
+            clauses.append('"' + " ".join(tokens) + '"')
+    remainder = re.sub(r'"[^"]*"', " ", question)
+
+    for term in remainder.split():
+        tokens = re.findall(r"\w+", term.lower())
+        if len(tokens) > 1:
+            clauses.append('"' + " ".join(tokens) + '"')
+        elif tokens and tokens[0] not in STOPWORDS:
+            clauses.append('"' + tokens[0] + '"')
+
+    clauses = list(dict.fromkeys(clauses))
+    return " OR ".join(clauses) if clauses else None
+
+
+class LexicalIndex:
+    """
+    BM25 index over chunk text, keyed by chunk ID.
+    Chunk rows live in a plain table; an external-content FTS5 table kept in
+    sync by triggers holds the postings, so deletes by document stay indexed.
+    """
+
+    def __init__(self, path: str):
+        Path(path).parent.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.executescript("""
+            CREATE TABLE IF NOT EXISTS chunks (
+                id INTEGER PRIMARY KEY,
+                chunk_id TEXT NOT NULL UNIQUE,
+                document_id TEXT NOT NULL,
+                text TEXT NOT NULL,
+                metadata TEXT NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS idx_chunks_document ON chunks(document_id);
+            CREATE VIRTUAL TABLE IF NOT EXISTS chunks_fts USING fts5(
+                text, content='chunks', content_rowid='id', tokenize='unicode61 remove_diacritics 2'
+            );
+            CREATE TRIGGER IF NOT EXISTS chunks_ai AFTER INSERT ON chunks BEGIN
+                INSERT INTO chunks_fts(rowid, text) VALUES (new.id, new.text);
+            END;
+            CREATE TRIGGER IF NOT EXISTS chunks_ad AFTER DELETE ON chunks BEGIN
+                INSERT INTO chunks_fts(chunks_fts, rowid, text) VALUES ('delete', old.id, old.text);
+            END;
+        """)
+        self._db.commit()
+
+    def upsert(self, ids: List[str], chunks: List[str], metadatas: List[Dict[str, Any]]):
+        """Index chunks, replacing any existing entries with the same IDs."""
+        with self._lock:
+            self._db.executemany("DELETE FROM chunks WHERE chunk_id = ?", [(i,) for i in ids])
+            self._db.executemany(
+                "INSERT INTO chunks (chunk_id, document_id, text, metadata) VALUES (?, ?, ?, ?)",
+                [
+                    (chunk_id, meta["document_id"], text, json.dumps(meta))
+                    for chunk_id, text, meta in zip(ids, chunks, metadatas)
+                ]
+            )
+            self._db.commit()
+
+    def delete_document(self, doc_id: str):
+        with self._lock:
+            self._db.execute("DELETE FROM chunks WHERE document_id = ?", (doc_id,))
+            self._db.commit()
+
+    def delete_chunks(self, ids: Iterable[str]):
+        with self._lock:
+            self._db.executemany("DELETE FROM chunks WHERE chunk_id = ?", [(i,) for i in ids])
+            self._db.commit()
+
+    def chunk_ids(self) -> Set[str]:
+        with self._lock:
+            return {row[0] for row in self._db.execute("SELECT chunk_id FROM chunks")}
+
+    def count(self) -> int:
+        with self._lock:
+            return self._db.execute("SELECT COUNT(*) FROM chunks").fetchone()[0]
+
+    def rebuild(self, batches: Iterable[Dict[str, List[Any]]]) -> int:
+        """
+        Re-index in place, e.g. from `vector_store.iter_chunks()`.
+        Existing entries stay searchable throughout; entries missing from
+        `batches` are left for the caller to remove with `delete_chunks`.
+        """
+        indexed = 0
+        for batch in batches:
+            self.upsert(batch["ids"], batch["documents"], batch["metadatas"])
+            indexed += len(batch["ids"])
+        return indexed
+
+    def query(self, question: str, n_results: int = 5, doc_ids: List[str] = None) -> Dict[str, Any]:
+        """
+        BM25 top-k for a free-text question.
+
+        Returns:
+            dict: Same shape as vector store results ("ids", "documents",
+            "metadatas") plus "scores" (higher is better)
+        """
+        empty = {"ids": [[]], "documents": [[]], "metadatas": [[]], "scores": [[]]}
+        match = build_match_query(question)
+        if not match:
+            return empty
+
+        sql = (
+            "SELECT c.chunk_id, c.text, c.metadata, bm25(chunks_fts) AS score "
+            "FROM chunks_fts JOIN chunks c ON c.id = chunks_fts.rowid "
+            "WHERE chunks_fts MATCH ?"
+        )
+        params: List[Any] = [match]
+        if doc_ids:
+            sql += f" AND c.document_id IN ({','.join('?' * len(doc_ids))})"
+            params.extend(doc_ids)
+        sql += " ORDER BY score LIMIT ?"
+        params.append(n_results)
+
+        with self._lock:
+            try:
+                rows = self._db.execute(sql, params).fetchall()
+            except sqlite3.OperationalError as e:
+                print(f"⚠️  Lexical query failed ({match}): {e}")
+                return empty
+
+        return {
+            "ids": [[r[0] for r in rows]],
+            "documents": [[r[1] for r in rows]],
+            "metadatas": [[json.loads(r[2]) for r in rows]],
+            # FTS5 bm25() is negated so that ascending order is best-first
+            "scores": [[-r[3] for r in rows]]
+        }
+
+
+def reciprocal_rank_fusion(result_sets: List[Dict[str, Any]], n_results: int, k: int = RRF_K) -> Dict[str, Any]:
+    """
+    Merge ranked result lists by summing 1 / (k + rank) per chunk ID.
+    Rank-based, so BM25 and cosine scores need no calibration.
+    """
+    fused: Dict[str, float] = {}
+    chunks: Dict[str, tuple] = {}
+    distances: Dict[str, float] = {}
+    for results in result_sets:
+        ids = results.get("ids", [[]])[0]
+        documents = results.get("documents", [[]])[0]
+        metadatas = results.get("metadatas", [[]])[0]
+        for rank, (chunk_id, text, meta) in enumerate(zip(ids, documents, metadatas)):
+            fused[chunk_id] = fused.get(chunk_id, 0.0) + 1.0 / (k + rank + 1)
+            chunks.setdefault(chunk_id, (text, meta))
+        # Keep vector distances so similarity cutoffs still apply after fusion
+        for chunk_id, distance in zip(ids, results.get("distances", [[]])[0]):
+            distances[chunk_id] = distance
+
+    ranked = sorted(fused, key=fused.get, reverse=True)[:n_results]
+    return {
+        "ids": [ranked],
+        "documents": [[chunks[i][0] for i in ranked]],
+        "metadatas": [[chunks[i][1] for i in ranked]],
+        # None for chunks found only lexically
+        "distances": [[distances.get(i) for i in ranked]]
+    }
@@ -29,6 +29,7 @@ class GeminiClient:
         Yields:
             str: Token chunks from the LLM
         """
+        response = None
         try:
             response = await self.client.aio.models.generate_content_stream(
                 model=self.model,
@@ -46,7 +47,35 @@ class GeminiClient:
                     
         except Exception as e:
             yield f"[Error: Gemini API failed - {str(e)}]"
+        finally:
+            # Stopped early (e.g. client disconnected): release the upstream
+            # connection now instead of when the generator is collected
+            if response is not None and hasattr(response, "aclose"):
+                await response.aclose()
     
+    async def agenerate(self, prompt: str, max_output_tokens: int = 100) -> str:
+        """
+        Non-streaming generation on the async client, so short side requests
+        (title generation, etc.) don't block the event loop.
+        
+        Args:
+            prompt: The prompt
+            max_output_tokens: Upper bound on response length
+            
+        Returns:
+            str: Complete response text
+        """
+        response = await self.client.aio.models.generate_content(
+            model=self.model,
+            contents=prompt,
+            config={
+                "temperature": 0.7,
+                "top_p": 0.9,
+                "max_output_tokens": max_output_tokens,
+            }
+        )
+        return response.text or ""
+
     def generate(self, prompt: str) -> str:
         """
         Non-streaming generation (for title generation, etc.)
@@ -82,6 +111,7 @@ class GeminiClient:
         Args:
             question: User's question
             context_chunks: List of dicts with 'text', 'filename', 'page' keys
+                and an optional 'section_title' (non-PDF documents)
             
         Returns:
             str: Formatted prompt for the LLM
@@ -89,6 +119,8 @@ class GeminiClient:
         context_parts = []
         for chunk in context_chunks:
             source = f"[Source: {chunk['filename']}, Page {chunk['page']}]"
+            if chunk.get('section_title'):
+                source += f" (Section: {chunk['section_title']})"
             context_parts.append(f"{source}\n{chunk['text']}")
         
         context_text = "\n\n".join(context_parts)
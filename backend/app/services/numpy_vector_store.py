@@ -0,0 +1,451 @@
+"""
+NumPy Vector Store for ChatPDF
+In-process exact-search backend: embeddings live in a memory-mapped float32
+matrix on disk, chunk text and metadata in a SQLite sidecar table.
+Cosine top-k is computed with vectorized dot products over unit vectors.
+
+With `settings.vector_quantization` set to "int8" or "float16", only compact
+codes are kept in RAM for candidate scoring; the top candidates are then
+re-scored exactly against the full-precision rows read through the mmap.
+"""
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Optional, Set
+import json
+import os
+import shutil
+import sqlite3
+import threading
+
+import numpy as np
+
+from ..config import settings
+from .base_vector_store import BaseVectorStore
+
+
+class NumpyVectorStore(BaseVectorStore):
+    """
+    Vector store backed by a memory-mapped matrix.
+
+    Row i of `vectors.f32` holds the L2-normalized embedding of the chunk
+    whose sidecar row is i. Deleted rows are tombstoned and reclaimed by
+    compaction once they make up a large share of the file.
+    """
+
+    QUANTIZATION_MODES = ("none", "int8", "float16")
+
+    backend_name = "numpy"
+
+    # Rows scored per matrix multiply; bounds temporary memory during search
+    SEARCH_BLOCK_ROWS = 16384
+    # Compact when at least this many rows, and half of all rows, are dead
+    COMPACT_MIN_DEAD = 10000
+
+    def __init__(self, name: str = "document_chunks", index_dir: str = None, quantization: str = None):
+        self.name = name
+        self.quantization = (quantization or settings.vector_quantization).lower()
+        if self.quantization not in self.QUANTIZATION_MODES:
+            raise ValueError(f"Unknown vector quantization: {self.quantization}")
+        self.rescore_factor = max(1, settings.vector_rescore_factor)
+        self.index_dir = Path(index_dir or settings.vector_index_dir) / name
+        self.index_dir.mkdir(parents=True, exist_ok=True)
+        self._vectors_path = self.index_dir / "vectors.f32"
+
+        self._lock = threading.RLock()
+        self._db = sqlite3.connect(str(self.index_dir / "metadata.sqlite3"), check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("""
+            CREATE TABLE IF NOT EXISTS chunks (
+                row INTEGER PRIMARY KEY,
+                chunk_id TEXT NOT NULL UNIQUE,
+                document_id TEXT NOT NULL,
+                text TEXT NOT NULL,
+                metadata TEXT NOT NULL
+            )
+        """)
+        self._db.execute("CREATE INDEX IF NOT EXISTS idx_chunks_document ON chunks(document_id)")
+        self._db.execute("CREATE TABLE IF NOT EXISTS info (key TEXT PRIMARY KEY, value TEXT NOT NULL)")
+        self._db.commit()
+
+        dim = self._get_info("dimensions")
+        self._dim: Optional[int] = int(dim) if dim else None
+        self._matrix: Optional[np.memmap] = None
+        self._codes: Optional[np.ndarray] = None
+        self._scales: Optional[np.ndarray] = None
+        self._capacity = 0
+        self._load()
+
+    # ------------------------------------------------------------------ #
+    # Storage management
+    # ------------------------------------------------------------------ #
+
+    def _get_info(self, key: str) -> Optional[str]:
+        row = self._db.execute("SELECT value FROM info WHERE key = ?", (key,)).fetchone()
+        return row[0] if row else None
+
+    def _set_info(self, key: str, value: Any):
+        self._db.execute("INSERT OR REPLACE INTO info (key, value) VALUES (?, ?)", (key, str(value)))
+
+    def _open_matrix(self):
+        self._matrix = None
+        if not self._dim or not self._vectors_path.exists():
+            self._capacity = 0
+            return
+        self._capacity = os.path.getsize(self._vectors_path) // (4 * self._dim)
+        if self._capacity:
+            self._matrix = np.memmap(self._vectors_path, dtype=np.float32, mode="r+", shape=(self._capacity, self._dim))
+
+    def _load(self):
+        """Rebuild in-memory row bookkeeping from the sidecar table."""
+        self._open_matrix()
+        rows = self._db.execute("SELECT row, document_id FROM chunks ORDER BY row").fetchall()
+        self._count = (rows[-1][0] + 1) if rows else 0
+        self._alive = np.zeros(max(self._capacity, self._count), dtype=bool)
+
+        doc_rows: Dict[str, List[int]] = {}
+        for row, doc_id in rows:
+            self._alive[row] = True
+            doc_rows.setdefault(doc_id, []).append(row)
+        self._doc_rows = {doc_id: np.asarray(r, dtype=np.int64) for doc_id, r in doc_rows.items()}
+        self._build_codes()
+
+    # ------------------------------------------------------------------ #
+    # Quantization
+    # ------------------------------------------------------------------ #
+
+    def _encode(self, vectors: np.ndarray):
+        """Quantize unit vectors: int8 with a per-row scale, or float16."""
+        if self.quantization == "float16":
+            return vectors.astype(np.float16), None
+        scales = np.abs(vectors).max(axis=1) / 127.0
+        scales[scales == 0] = 1.0
+        codes = np.rint(vectors / scales[:, None]).astype(np.int8)
+        return codes, scales.astype(np.float32)
+
+    def _build_codes(self):
+        """(Re)build in-memory codes for every allocated row from the mmap."""
+        self._codes, self._scales = None, None
+        if self.quantization == "none" or self._matrix is None:
+            return
+        dtype = np.float16 if self.quantization == "float16" else np.int8
+        self._codes = np.zeros((self._capacity, self._dim), dtype=dtype)
+        if self.quantization == "int8":
+            self._scales = np.ones(self._capacity, dtype=np.float32)
+        for start in range(0, self._count, self.SEARCH_BLOCK_ROWS):
+            end = min(start + self.SEARCH_BLOCK_ROWS, self._count)
+            codes, scales = self._encode(np.asarray(self._matrix[start:end]))
+            self._codes[start:end] = codes
+            if scales is not None:
+                self._scales[start:end] = scales
+
+    def _grow_codes(self):
+        if self._codes is None:
+            self._build_codes()
+            return
+        codes = np.zeros((self._capacity, self._dim), dtype=self._codes.dtype)
+        codes[:len(self._codes)] = self._codes
+        self._codes = codes
+        if self._scales is not None:
+            scales = np.ones(self._capacity, dtype=np.float32)
+            scales[:len(self._scales)] = self._scales
+            self._scales = scales
+
+    def _ensure_capacity(self, needed: int):
+        if needed <= self._capacity:
+            return
+        new_capacity = max(needed, self._capacity * 2, 1024)
+        if self._matrix is not None:
+            self._matrix.flush()
+            self._matrix = None
+        with open(self._vectors_path, "ab") as f:
+            f.truncate(new_capacity * self._dim * 4)
+        self._open_matrix()
+        alive = np.zeros(new_capacity, dtype=bool)
+        alive[:len(self._alive)] = self._alive
+        self._alive = alive
+        if self.quantization != "none":
+            self._grow_codes()
+
+    def _maybe_compact(self):
+        dead = self._count - int(self._alive[:self._count].sum())
+        if dead >= self.COMPACT_MIN_DEAD and dead * 2 >= self._count:
+            self.compact()
+
+    def compact(self):
+        """Rewrite the matrix without tombstoned rows and renumber the sidecar."""
+        with self._lock:
+            live_rows = np.flatnonzero(self._alive[:self._count])
+            tmp_path = self._vectors_path.with_suffix(".f32.tmp")
+            with open(tmp_path, "wb") as out:
+                for start in range(0, len(live_rows), self.SEARCH_BLOCK_ROWS):
+                    block = live_rows[start:start + self.SEARCH_BLOCK_ROWS]
+                    out.write(np.ascontiguousarray(self._matrix[block]).tobytes())
+
+            # Ascending order is safe: each target row is free or already moved
+            self._db.executemany(
+                "UPDATE chunks SET row = ? WHERE row = ?",
+                [(new, int(old)) for new, old in enumerate(live_rows) if new != old]
+            )
+            self._db.commit()
+
+            self._matrix.flush()
+            self._matrix = None
+            os.replace(tmp_path, self._vectors_path)
+            self._load()
+            print(f"✅ Compacted vector index {self.name}: {len(live_rows)} live rows")
+
+    # ------------------------------------------------------------------ #
+    # BaseVectorStore implementation
+    # ------------------------------------------------------------------ #
+
+    def _upsert(self, ids, chunks, embeddings, metadatas):
+        if not ids:
+            return
+        vectors = np.asarray(embeddings, dtype=np.float32)
+        if vectors.ndim != 2 or len(vectors) != len(ids):
+            raise ValueError("Embeddings must be a list of equal-length vectors, one per chunk")
+
+        with self._lock:
+            if self._dim is None:
+                self._dim = vectors.shape[1]
+                self._set_info("dimensions", self._dim)
+            elif vectors.shape[1] != self._dim:
+                raise ValueError(f"Embedding dimension {vectors.shape[1]} does not match index dimension {self._dim}")
+
+            norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+            norms[norms == 0] = 1.0
+            vectors = vectors / norms
+
+            existing: Dict[str, int] = {}
+            for start in range(0, len(ids), 500):
+                part = ids[start:start + 500]
+                placeholders = ",".join("?" * len(part))
+                for chunk_id, row in self._db.execute(
+                    f"SELECT chunk_id, row FROM chunks WHERE chunk_id IN ({placeholders})", part
+                ):
+                    existing[chunk_id] = row
+
+            rows = []
+            for chunk_id in ids:
+                if chunk_id in existing:
+                    rows.append(existing[chunk_id])
+                else:
+                    rows.append(self._count)
+                    existing[chunk_id] = self._count
+                    self._count += 1
+
+            self._ensure_capacity(self._count)
+            row_index = np.asarray(rows, dtype=np.int64)
+            self._matrix[row_index] = vectors
+            self._matrix.flush()
+            if self._codes is not None:
+                codes, scales = self._encode(vectors)
+                self._codes[row_index] = codes
+                if scales is not None:
+                    self._scales[row_index] = scales
+
+            self._db.executemany(
+                "INSERT OR REPLACE INTO chunks (row, chunk_id, document_id, text, metadata) VALUES (?, ?, ?, ?, ?)",
+                [
+                    (row, chunk_id, meta["document_id"], text, json.dumps(meta))
+                    for row, chunk_id, text, meta in zip(rows, ids, chunks, metadatas)
+                ]
+            )
+            self._db.commit()
+
+            self._alive[row_index] = True
+            by_doc: Dict[str, List[int]] = {}
+            for row, meta in zip(rows, metadatas):
+                by_doc.setdefault(meta["document_id"], []).append(row)
+            for doc_id, new_rows in by_doc.items():
+                current = self._doc_rows.get(doc_id)
+                merged = new_rows if current is None else np.concatenate([current, new_rows])
+                self._doc_rows[doc_id] = np.unique(np.asarray(merged, dtype=np.int64))
+
+    def _delete_document(self, doc_id: str):
+        with self._lock:
+            rows = self._doc_rows.pop(doc_id, None)
+            self._db.execute("DELETE FROM chunks WHERE document_id = ?", (doc_id,))
+            self._db.commit()
+            if rows is not None:
+                self._alive[rows] = False
+            self._maybe_compact()
+
+    def _candidate_rows(self, doc_ids: Optional[List[str]]) -> Optional[np.ndarray]:
+        """
+        Rows to score for a filtered search, or None for the whole index.
+        Each document's row array is its partition, so filtered search cost
+        scales with the selected documents rather than the whole index.
+        """
+        if not doc_ids:
+            return None
+        parts = [self._doc_rows[d] for d in doc_ids if d in self._doc_rows]
+        return np.concatenate(parts) if parts else np.empty(0, dtype=np.int64)
+
+    def _block_scores(self, query: np.ndarray, block, exact: bool) -> np.ndarray:
+        """Scores for a slice or index array of rows, from codes or full vectors."""
+        if exact or self._codes is None:
+            return np.asarray(self._matrix[block] @ query, dtype=np.float32)
+        scores = self._codes[block].astype(np.float32) @ query
+        if self._scales is not None:
+            scores *= self._scales[block]
+        return scores
+
+    def _top_k(self, query: np.ndarray, rows: Optional[np.ndarray], k: int, exact: bool = False):
+        """Cosine top-k over `rows` (or every live row), scored in blocks."""
+        best_rows = np.empty(0, dtype=np.int64)
+        best_scores = np.empty(0, dtype=np.float32)
+        total = self._count if rows is None else len(rows)
+
+        for start in range(0, total, self.SEARCH_BLOCK_ROWS):
+            end = min(start + self.SEARCH_BLOCK_ROWS, total)
+            if rows is None:
+                block_rows = np.arange(start, end)
+                scores = self._block_scores(query, slice(start, end), exact)
+                scores[~self._alive[start:end]] = -np.inf
+            else:
+                block_rows = rows[start:end]
+                scores = self._block_scores(query, block_rows, exact)
+
+            best_rows = np.concatenate([best_rows, block_rows])
+            best_scores = np.concatenate([best_scores, scores])
+            if len(best_scores) > k:
+                keep = np.argpartition(-best_scores, k - 1)[:k]
+                best_rows, best_scores = best_rows[keep], best_scores[keep]
+
+        valid = np.isfinite(best_scores)
+        best_rows, best_scores = best_rows[valid], best_scores[valid]
+        order = np.argsort(-best_scores)
+        return best_rows[order], best_scores[order]
+
+    def _search(self, query: np.ndarray, rows: Optional[np.ndarray], k: int):
+        """Top-k search; quantized indexes shortlist on codes, then re-score exactly."""
+        if self._codes is None:
+            return self._top_k(query, rows, k, exact=True)
+        candidates, _ = self._top_k(query, rows, k * self.rescore_factor)
+        candidates = np.sort(candidates)  # sequential mmap reads
+        return self._top_k(query, candidates, k, exact=True)
+
+    def _fetch_rows(self, rows: List[int]) -> Dict[int, tuple]:
+        if not rows:
+            return {}
+        placeholders = ",".join("?" * len(rows))
+        return {
+            row: (chunk_id, text, json.loads(meta))
+            for row, chunk_id, text, meta in self._db.execute(
+                f"SELECT row, chunk_id, text, metadata FROM chunks WHERE row IN ({placeholders})", rows
+            )
+        }
+
+    def query(
+        self,
+        query_embedding: List[float],
+        n_results: int = 5,
+        doc_ids: List[str] = None
+    ) -> Dict[str, Any]:
+        """Query the vector store for similar chunks."""
+        with self._lock:
+            if self._matrix is None or self._count == 0:
+                return {"ids": [[]], "documents": [[]], "metadatas": [[]], "distances": [[]]}
+
+            query = np.asarray(query_embedding, dtype=np.float32)
+            norm = np.linalg.norm(query)
+            if norm > 0:
+                query = query / norm
+
+            rows, scores = self._search(query, self._candidate_rows(doc_ids), n_results)
+            rows = [int(r) for r in rows]
+            fetched = self._fetch_rows(rows)
+
+        hits = [(fetched[r], float(score)) for r, score in zip(rows, scores) if r in fetched]
+        return {
+            "ids": [[chunk_id for (chunk_id, _, _), _ in hits]],
+            "documents": [[text for (_, text, _), _ in hits]],
+            "metadatas": [[meta for (_, _, meta), _ in hits]],
+            # Cosine distance, as reported by Chroma
+            "distances": [[1.0 - score for _, score in hits]]
+        }
+
+    def _rows_to_chunks(self, records: List[tuple]) -> Dict[str, List[Any]]:
+        rows = np.asarray([r[0] for r in records], dtype=np.int64)
+        embeddings = self._matrix[rows].tolist() if len(rows) else []
+        return {
+            "ids": [r[1] for r in records],
+            "documents": [r[2] for r in records],
+            "embeddings": embeddings,
+            "metadatas": [json.loads(r[3]) for r in records]
+        }
+
+    def get_chunks(self, ids: List[str]) -> Dict[str, List[Any]]:
+        records = []
+        with self._lock:
+            # Stay under SQLite's bound-parameter limit
+            for i in range(0, len(ids), 500):
+                part = ids[i:i + 500]
+                records.extend(self._db.execute(
+                    f"SELECT chunk_id, text, metadata FROM chunks WHERE chunk_id IN ({','.join('?' * len(part))})",
+                    part
+                ).fetchall())
+        return {
+            "ids": [r[0] for r in records],
+            "documents": [r[1] for r in records],
+            "metadatas": [json.loads(r[2]) for r in records]
+        }
+
+    def get_document_chunks(self, doc_id: str) -> Dict[str, List[Any]]:
+        with self._lock:
+            records = self._db.execute(
+                "SELECT row, chunk_id, text, metadata FROM chunks WHERE document_id = ? ORDER BY row",
+                (doc_id,)
+            ).fetchall()
+            return self._rows_to_chunks(records)
+
+    def iter_chunks(self, batch_size: int = 500) -> Iterator[Dict[str, List[Any]]]:
+        last_row = -1
+        while True:
+            with self._lock:
+                records = self._db.execute(
+                    "SELECT row, chunk_id, text, metadata FROM chunks WHERE row > ? ORDER BY row LIMIT ?",
+                    (last_row, batch_size)
+                ).fetchall()
+                if not records:
+                    return
+                batch = self._rows_to_chunks(records)
+            last_row = records[-1][0]
+            yield batch
+
+    def list_ids(self) -> Set[str]:
+        with self._lock:
+            return {row[0] for row in self._db.execute("SELECT chunk_id FROM chunks")}
+
+    def drop(self):
+        with self._lock:
+            self._db.close()
+            self._matrix = None
+            self._codes = None
+            shutil.rmtree(self.index_dir, ignore_errors=True)
+
+    def get_collection_stats(self) -> Dict[str, Any]:
+        """Get collection statistics for health checks."""
+        with self._lock:
+            count = self._db.execute("SELECT COUNT(*) FROM chunks").fetchone()[0]
+            return {
+                "name": self.name,
+                "count": count,
+                "backend": self.backend_name,
+                "path": str(self.index_dir),
+                "dimensions": self._dim,
+                "rows_allocated": self._capacity,
+                "quantization": self.quantization,
+                "memory_per_chunk_bytes": self._memory_per_chunk(),
+                "resident_index_mb": round(self._memory_per_chunk() * self._capacity / (1024 * 1024), 2)
+            }
+
+    def _memory_per_chunk(self) -> int:
+        """RAM needed per chunk for candidate scoring (full vectors stay on disk when quantized)."""
+        if not self._dim:
+            return 0
+        if self.quantization == "int8":
+            return self._dim + 4  # int8 codes + float32 scale
+        if self.quantization == "float16":
+            return self._dim * 2
+        return self._dim * 4
@@ -0,0 +1,129 @@
+"""
+Per-Document Vector Partitions for ChatPDF
+Keeps each document's chunk vectors as a small in-memory matrix so
+document-filtered queries can be answered by exact brute-force search over
+just the selected documents instead of a filtered walk of the global index.
+"""
+from collections import OrderedDict
+from typing import Any, Callable, Dict, List, Optional
+import threading
+
+import numpy as np
+
+
+class DocumentPartition:
+    """Chunks of one document with L2-normalized float32 vectors."""
+
+    def __init__(self, ids: List[str], documents: List[str], metadatas: List[Dict[str, Any]], embeddings):
+        self.ids = list(ids)
+        self.documents = list(documents)
+        self.metadatas = list(metadatas)
+        matrix = np.asarray(embeddings, dtype=np.float32)
+        if not self.ids:
+            matrix = np.zeros((0, 0), dtype=np.float32)
+        norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+        norms[norms == 0] = 1.0
+        self.matrix = matrix / norms
+
+    @property
+    def nbytes(self) -> int:
+        return self.matrix.nbytes
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+
+class PartitionCache:
+    """
+    LRU cache of document partitions bounded by total matrix size.
+    Also remembers per-document chunk counts so the planner can decide
+    between exact and ANN search without loading vectors.
+    """
+
+    def __init__(self, loader: Callable[[str], Dict[str, List[Any]]], max_bytes: int):
+        self.loader = loader
+        self.max_bytes = max_bytes
+        self._partitions: "OrderedDict[str, DocumentPartition]" = OrderedDict()
+        self._counts: Dict[str, int] = {}
+        self._bytes = 0
+        self._lock = threading.Lock()
+        # Bumped on invalidation so a load racing with a write is not cached
+        self._generation = 0
+
+        self._loads = 0
+        self._hits = 0
+
+    def get(self, doc_id: str) -> DocumentPartition:
+        with self._lock:
+            partition = self._partitions.get(doc_id)
+            if partition is not None:
+                self._partitions.move_to_end(doc_id)
+                self._hits += 1
+                return partition
+            generation = self._generation
+
+        data = self.loader(doc_id)
+        partition = DocumentPartition(data["ids"], data["documents"], data["metadatas"], data["embeddings"])
+        with self._lock:
+            self._loads += 1
+            if generation != self._generation:
+                return partition
+            self._counts[doc_id] = len(partition)
+            if doc_id not in self._partitions:
+                self._partitions[doc_id] = partition
+                self._bytes += partition.nbytes
+                while self._bytes > self.max_bytes and len(self._partitions) > 1:
+                    _, evicted = self._partitions.popitem(last=False)
+                    self._bytes -= evicted.nbytes
+        return partition
+
+    def get_count(self, doc_id: str) -> Optional[int]:
+        with self._lock:
+            return self._counts.get(doc_id)
+
+    def set_count(self, doc_id: str, count: int):
+        with self._lock:
+            self._counts[doc_id] = count
+
+    def invalidate(self, doc_id: str):
+        with self._lock:
+            self._generation += 1
+            self._counts.pop(doc_id, None)
+            partition = self._partitions.pop(doc_id, None)
+            if partition is not None:
+                self._bytes -= partition.nbytes
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "partitions_cached": len(self._partitions),
+                "cached_mb": round(self._bytes / (1024 * 1024), 2),
+                "loads": self._loads,
+                "hits": self._hits,
+            }
+
+
+def exact_search(partitions: List[DocumentPartition], query_embedding: List[float], n_results: int) -> Dict[str, Any]:
+    """Brute-force cosine top-k over the given partitions only."""
+    query = np.asarray(query_embedding, dtype=np.float32)
+    norm = np.linalg.norm(query)
+    if norm > 0:
+        query = query / norm
+
+    candidates = []  # (score, partition, index)
+    for partition in partitions:
+        if not len(partition):
+            continue
+        scores = partition.matrix @ query
+        k = min(n_results, len(scores))
+        top = np.argpartition(-scores, k - 1)[:k]
+        candidates.extend((float(scores[i]), partition, int(i)) for i in top)
+
+    candidates.sort(key=lambda c: c[0], reverse=True)
+    candidates = candidates[:n_results]
+    return {
+        "ids": [[p.ids[i] for _, p, i in candidates]],
+        "documents": [[p.documents[i] for _, p, i in candidates]],
+        "metadatas": [[p.metadatas[i] for _, p, i in candidates]],
+        "distances": [[1.0 - score for score, _, _ in candidates]]
+    }
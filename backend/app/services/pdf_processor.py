@@ -29,17 +29,9 @@ class PDFProcessor:
 
     @staticmethod
     def extract_pages(file_path: str) -> List[Dict[str, Any]]:
-        """Extract text page by page with page numbers."""
-        pages = []
-        with open(file_path, "rb") as file:
-            reader = PyPDF2.PdfReader(file)
-            for i, page in enumerate(reader.pages):
-                page_text = page.extract_text()
-                if page_text:
-                    pages.append({
-                        "page_number": i + 1,
-                        "content": page_text
-                    })
+        """Extract text page by page with page numbers (parallel for large PDFs)."""
+        from .document_processor import DocumentProcessor
+        pages, _ = DocumentProcessor._extract_pdf_pages(file_path)
         return pages
 
     @staticmethod
@@ -0,0 +1,113 @@
+"""
+Query Cache for ChatPDF
+In-process LRU cache of question embeddings and top-k retrieval results,
+keyed on normalized question text and the selected document IDs.
+Entries touching a document are invalidated whenever its vectors change.
+"""
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Tuple
+import re
+import threading
+import time
+
+from ..config import settings
+
+
+CacheKey = Tuple[str, Optional[Tuple[str, ...]], int]
+
+
+class QueryCacheEntry:
+    def __init__(self, embedding: List[float], results: Optional[Dict[str, Any]]):
+        self.embedding = embedding
+        self.results = results
+        self.created_at = time.monotonic()
+
+
+class QueryCache:
+    """Bounded, TTL-limited LRU cache. Safe to share between threads."""
+
+    def __init__(self, max_entries: int = 512, ttl_seconds: float = 600):
+        self.max_entries = max_entries
+        self.ttl = ttl_seconds
+        self._entries: "OrderedDict[CacheKey, QueryCacheEntry]" = OrderedDict()
+        self._lock = threading.Lock()
+        # Bumped on every invalidation so results computed concurrently with
+        # an index change are not cached
+        self.generation = 0
+
+        self._hits = 0
+        self._embedding_hits = 0
+        self._misses = 0
+        self._invalidations = 0
+
+    @staticmethod
+    def normalize(question: str) -> str:
+        """Case-fold, collapse whitespace and drop trailing punctuation."""
+        text = re.sub(r"\s+", " ", question.strip().lower())
+        return text.rstrip("?!. ")
+
+    def make_key(self, question: str, doc_ids: Optional[List[str]], n_results: int) -> CacheKey:
+        return (self.normalize(question), tuple(sorted(set(doc_ids))) if doc_ids else None, n_results)
+
+    def get(self, key: CacheKey) -> Optional[QueryCacheEntry]:
+        """
+        Return the cached entry (refreshing its LRU position) or None.
+        An entry whose results were invalidated still carries the embedding.
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or time.monotonic() - entry.created_at > self.ttl:
+                if entry is not None:
+                    del self._entries[key]
+                self._misses += 1
+                return None
+            self._entries.move_to_end(key)
+            if entry.results is not None:
+                self._hits += 1
+            else:
+                self._embedding_hits += 1
+            return entry
+
+    def put(self, key: CacheKey, embedding: List[float], results: Optional[Dict[str, Any]], generation: int = None):
+        """Store an entry; results are dropped if an invalidation happened since `generation`."""
+        with self._lock:
+            if generation is not None and generation != self.generation:
+                results = None
+            self._entries[key] = QueryCacheEntry(embedding, results)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def invalidate_document(self, doc_id: str):
+        """Drop retrieval results that could include chunks of this document."""
+        with self._lock:
+            self.generation += 1
+            for key, entry in self._entries.items():
+                doc_ids = key[1]
+                if entry.results is not None and (doc_ids is None or doc_id in doc_ids):
+                    # The question embedding is still valid; only results go stale
+                    entry.results = None
+                    self._invalidations += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self._hits + self._embedding_hits + self._misses
+            return {
+                "entries": len(self._entries),
+                "hits": self._hits,
+                "embedding_only_hits": self._embedding_hits,
+                "misses": self._misses,
+                "hit_rate": round(self._hits / lookups, 4) if lookups else 0.0,
+                "invalidations": self._invalidations,
+            }
+
+
+# Singleton instance
+query_cache = QueryCache(
+    max_entries=settings.query_cache_size,
+    ttl_seconds=settings.query_cache_ttl_seconds
+)
@@ -0,0 +1,95 @@
+"""
+Query Embedding Coalescer for ChatPDF
+Collects single-text embedding requests that arrive within a short window
+and sends them upstream as one batched embed_content call.
+"""
+from typing import Awaitable, Callable, Dict, List, Set, Tuple
+import asyncio
+
+
+class QueryEmbeddingCoalescer:
+    """
+    Micro-batcher for concurrent query embeddings.
+
+    The first request in an empty window schedules a flush `window_ms` later;
+    the window is flushed early once `max_batch` distinct texts are waiting.
+    Identical texts in the same window share one upstream slot.
+    """
+
+    def __init__(
+        self,
+        embed_batch: Callable[[List[str], str], Awaitable[List[List[float]]]],
+        window_ms: int = 10,
+        max_batch: int = 32
+    ):
+        self.embed_batch = embed_batch
+        self.window = window_ms / 1000
+        self.max_batch = max(1, max_batch)
+
+        self._loop = None
+        self._pending: Dict[str, Dict[str, List[asyncio.Future]]] = {}
+        self._timers: Dict[str, asyncio.TimerHandle] = {}
+        # Strong references to in-flight sends (the event loop only keeps weak ones)
+        self._sends: Set[asyncio.Task] = set()
+
+        self._requests = 0
+        self._upstream_calls = 0
+        self._upstream_items = 0
+
+    async def embed(self, text: str, task_type: str = "retrieval_query") -> List[float]:
+        """Embed one text, sharing an upstream call with concurrent callers."""
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop:
+            self._loop = loop
+            self._pending = {}
+            self._timers = {}
+
+        self._requests += 1
+        future = loop.create_future()
+        pending = self._pending.setdefault(task_type, {})
+        pending.setdefault(text, []).append(future)
+
+        if len(pending) >= self.max_batch:
+            self._flush(task_type)
+        elif task_type not in self._timers:
+            self._timers[task_type] = loop.call_later(self.window, self._flush, task_type)
+
+        return await future
+
+    def _flush(self, task_type: str):
+        timer = self._timers.pop(task_type, None)
+        if timer:
+            timer.cancel()
+        pending = self._pending.pop(task_type, None)
+        if pending:
+            task = asyncio.ensure_future(self._send(task_type, pending))
+            self._sends.add(task)
+            task.add_done_callback(self._sends.discard)
+
+    async def _send(self, task_type: str, pending: Dict[str, List[asyncio.Future]]):
+        texts = list(pending.keys())
+        self._upstream_calls += 1
+        self._upstream_items += len(texts)
+        try:
+            vectors = await self.embed_batch(texts, task_type)
+            if len(vectors) != len(texts):
+                raise ValueError(f"Expected {len(texts)} embeddings, got {len(vectors)}")
+        except Exception as e:
+            for futures in pending.values():
+                for future in futures:
+                    if not future.done():
+                        future.set_exception(e)
+            return
+
+        for text, vector in zip(texts, vectors):
+            for future in pending[text]:
+                if not future.done():
+                    future.set_result(vector)
+
+    def stats(self) -> Dict[str, float]:
+        """Requests received vs. upstream calls actually made."""
+        return {
+            "requests": self._requests,
+            "upstream_calls": self._upstream_calls,
+            "avg_batch_size": round(self._upstream_items / self._upstream_calls, 2) if self._upstream_calls else 0.0,
+        }
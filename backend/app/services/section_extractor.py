@@ -0,0 +1,225 @@
+"""
+Structure-Aware Section Extraction for ChatPDF
+Splits DOCX, HTML, Markdown and plain text into sections along the
+document's own structure (headings, tables, block elements, paragraphs)
+instead of fixed-size character slices. Each section carries its heading
+path and its character offset in the extracted text.
+"""
+from typing import Any, Dict, List, Optional
+import re
+
+# Heading levels recognized in each format
+HTML_HEADINGS = {f"h{level}": level for level in range(1, 7)}
+HTML_BLOCKS = {
+    "p", "li", "pre", "blockquote", "tr", "dt", "dd", "caption",
+    "figcaption", "address", "summary", "td", "th"
+}
+HTML_SKIP = {"script", "style", "noscript", "head", "template", "svg", "nav", "footer"}
+# Phrasing elements: their text joins the surrounding paragraph. Any other
+# element that is not a heading, table or block above is a container whose
+# start and end break paragraphs
+HTML_INLINE = {
+    "a", "abbr", "b", "bdi", "bdo", "cite", "code", "data", "del", "dfn", "em",
+    "font", "i", "img", "ins", "kbd", "label", "mark", "q", "s", "samp", "small",
+    "span", "strong", "sub", "sup", "time", "u", "var", "wbr"
+}
+
+MARKDOWN_HEADING = re.compile(r"^(#{1,6})\s+(.*?)\s*#*\s*$")
+MARKDOWN_FENCE = re.compile(r"^\s*(```|~~~)")
+
+# Separator between blocks and sections in the document's extracted text
+SECTION_SEPARATOR = "\n\n"
+# Separator between the headings of sections merged into one
+TITLE_SEPARATOR = "; "
+
+
+class SectionBuilder:
+    """
+    Collects headings and text blocks in reading order.
+
+    A section smaller than `min_chars` absorbs the sections after it (up to
+    `max_chars`) so documents with many short headed sections don't produce
+    many tiny chunks; the merged section's title lists all their headings.
+    Text between headings is grouped up to `max_chars` per section, always
+    breaking between blocks, never inside one.
+    """
+
+    def __init__(self, min_chars: int = 500, max_chars: int = 4000):
+        self.min_chars = min_chars
+        self.max_chars = max_chars
+        self._headings: List[tuple] = []  # (level, title)
+        self._sections: List[Dict[str, Any]] = []
+        self._blocks: List[str] = []
+        self._title: Optional[str] = None
+
+    def _flush(self):
+        if self._blocks:
+            self._sections.append({"title": self._title, "blocks": self._blocks})
+        self._blocks = []
+
+    def heading(self, level: int, title: str):
+        title = " ".join(title.split())
+        if not title:
+            return
+        self._flush()
+        while self._headings and self._headings[-1][0] >= level:
+            self._headings.pop()
+        self._headings.append((level, title))
+        self._title = " > ".join(t for _, t in self._headings)
+        self._blocks = [title]
+
+    def block(self, text: str):
+        text = text.strip()
+        if not text:
+            return
+        if self._blocks and sum(len(b) for b in self._blocks) + len(text) > self.max_chars:
+            self._flush()
+        self._blocks.append(text)
+
+    def sections(self) -> List[Dict[str, Any]]:
+        """Finished sections as pages: page_number, content, section_title, offset."""
+        self._flush()
+
+        merged: List[Dict[str, Any]] = []
+        for section in self._sections:
+            content = SECTION_SEPARATOR.join(section["blocks"])
+            if merged and len(merged[-1]["content"]) < self.min_chars \
+                    and len(merged[-1]["content"]) + len(content) <= self.max_chars:
+                merged[-1]["content"] += SECTION_SEPARATOR + content
+                # Every heading whose text went in is named, so citations of
+                # absorbed sections still point at the right heading
+                if section["title"] and section["title"] not in merged[-1]["titles"]:
+                    merged[-1]["titles"].append(section["title"])
+                continue
+            merged.append({"content": content, "titles": [section["title"]] if section["title"] else []})
+
+        pages = []
+        offset = 0
+        for number, section in enumerate(merged, start=1):
+            page = {"page_number": number, "content": section["content"], "offset": offset}
+            if section["titles"]:
+                page["section_title"] = TITLE_SEPARATOR.join(section["titles"])
+            pages.append(page)
+            offset += len(section["content"]) + len(SECTION_SEPARATOR)
+        return pages
+
+
+def docx_sections(file_path: str, builder: SectionBuilder) -> List[Dict[str, Any]]:
+    """Headings, paragraphs and tables of a Word document, in body order."""
+    try:
+        from docx import Document
+        from docx.table import Table
+        from docx.text.paragraph import Paragraph
+    except ImportError:
+        raise ImportError("python-docx is required for DOCX support. Install: pip install python-docx")
+
+    doc = Document(file_path)
+    for element in doc.element.body.iterchildren():
+        tag = element.tag.rsplit("}", 1)[-1]
+        if tag == "p":
+            paragraph = Paragraph(element, doc)
+            style = (paragraph.style.name if paragraph.style is not None else "") or ""
+            match = re.match(r"(Heading|Title)\s*(\d*)", style)
+            if match and paragraph.text.strip():
+                level = int(match.group(2)) if match.group(2) else 1
+                builder.heading(level, paragraph.text)
+            else:
+                builder.block(paragraph.text)
+        elif tag == "tbl":
+            # One line per row keeps table rows together in the same chunk
+            rows = []
+            for row in Table(element, doc).rows:
+                cells = list(dict.fromkeys(cell.text.strip() for cell in row.cells))
+                if any(cells):
+                    rows.append(" | ".join(cells))
+            builder.block("\n".join(rows))
+    return builder.sections()
+
+
+def html_sections(file_path: str, builder: SectionBuilder, parser: str = "html.parser") -> List[Dict[str, Any]]:
+    """h1–h6 start sections; block elements and runs of inline text become paragraphs. `parser` is a BeautifulSoup tree builder."""
+    try:
+        from bs4 import BeautifulSoup, NavigableString, Tag
+    except ImportError:
+        raise ImportError("beautifulsoup4 is required for HTML support. Install: pip install beautifulsoup4")
+
+    with open(file_path, 'r', encoding='utf-8', errors='ignore') as file:
+        soup = BeautifulSoup(file.read(), parser)
+    for br in soup.find_all("br"):
+        br.replace_with("\n")
+
+    def text_of(tag) -> str:
+        # No separator: inline markup inside a word ("<b>Hel</b>lo") must not split it
+        return " ".join(tag.get_text().split())
+
+    # Loose text and inline elements between block boundaries
+    inline: List[str] = []
+
+    def end_paragraph():
+        builder.block(" ".join("".join(inline).split()))
+        inline.clear()
+
+    def walk(node):
+        for child in node.children:
+            if isinstance(child, Tag):
+                name = child.name.lower()
+                if name in HTML_SKIP:
+                    continue
+                if name in HTML_INLINE:
+                    walk(child)
+                    continue
+                end_paragraph()
+                if name in HTML_HEADINGS:
+                    builder.heading(HTML_HEADINGS[name], text_of(child))
+                elif name == "table":
+                    # One line per row keeps table rows together in the same chunk
+                    builder.block("\n".join(
+                        " | ".join(text_of(cell) for cell in row.find_all(["td", "th"]))
+                        for row in child.find_all("tr")
+                    ))
+                elif name in HTML_BLOCKS:
+                    builder.block(text_of(child))
+                else:
+                    walk(child)
+                    end_paragraph()
+            elif type(child) is NavigableString:
+                # Comments, doctypes and CDATA are NavigableString subclasses and are skipped
+                inline.append(str(child))
+
+    walk(soup.body or soup)
+    end_paragraph()
+    return builder.sections()
+
+
+def markdown_sections(text: str, builder: SectionBuilder) -> List[Dict[str, Any]]:
+    """ATX headings start sections; blank lines separate paragraphs."""
+    paragraph: List[str] = []
+    in_fence = False
+
+    def end_paragraph():
+        if paragraph:
+            builder.block("\n".join(paragraph))
+            paragraph.clear()
+
+    for line in text.splitlines():
+        if MARKDOWN_FENCE.match(line):
+            in_fence = not in_fence
+            paragraph.append(line)
+            continue
+        heading = None if in_fence else MARKDOWN_HEADING.match(line)
+        if heading:
+            end_paragraph()
+            builder.heading(len(heading.group(1)), heading.group(2))
+        elif not line.strip() and not in_fence:
+            end_paragraph()
+        else:
+            paragraph.append(line)
+    end_paragraph()
+    return builder.sections()
+
+
+def text_sections(text: str, builder: SectionBuilder) -> List[Dict[str, Any]]:
+    """Plain text has no headings: group whole paragraphs into sections."""
+    for block in re.split(r"\n\s*\n", text):
+        builder.block(block)
+    return builder.sections()
@@ -0,0 +1,245 @@
+"""
+SSE Framing for ChatPDF
+Encodes chat stream events as Server-Sent Events frames. Consecutive answer
+tokens are coalesced into one `chunk` frame until a time or size threshold
+is reached, idle streams get keep-alive comments, a client disconnect
+cancels the upstream work (and waits for it to clean up), and every stream records frame/byte/flush-latency
+counters for tuning.
+"""
+from collections import OrderedDict
+from typing import Any, AsyncIterator, Dict, List, Optional
+import asyncio
+import json
+import threading
+import time
+
+import anyio
+
+from ..config import settings
+
+try:
+    import orjson
+except ImportError:  # optional: faster JSON encoding
+    orjson = None
+
+KEEPALIVE_FRAME = b": keep-alive\n\n"
+# Finished streams kept for the stats endpoint
+RECENT_STREAMS = 100
+# Seconds upstream work gets to clean up (e.g. save a partial answer) after a disconnect
+CANCEL_GRACE_SECONDS = 5.0
+
+
+def encode_event(event: Dict[str, Any]) -> bytes:
+    """One `data:` frame for an event."""
+    if orjson is not None:
+        payload = orjson.dumps(event, default=str, option=orjson.OPT_SERIALIZE_NUMPY)
+    else:
+        payload = json.dumps(event, default=str, separators=(",", ":"), ensure_ascii=False).encode("utf-8")
+    return b"data: " + payload + b"\n\n"
+
+
+class StreamStats:
+    """Counters for one SSE stream."""
+
+    def __init__(self, stream_id: str):
+        self.stream_id = stream_id
+        self.started = time.time()
+        self.finished: Optional[float] = None
+        self.events = 0
+        self.tokens = 0
+        self.frames = 0
+        self.bytes = 0
+        self.keepalives = 0
+        self.cancelled = False
+        self.flushes = 0
+        self.flush_latency_total = 0.0
+        self.flush_latency_max = 0.0
+
+    def frame(self, data: bytes):
+        self.frames += 1
+        self.bytes += len(data)
+
+    def flushed(self, waited: float):
+        self.flushes += 1
+        self.flush_latency_total += waited
+        self.flush_latency_max = max(self.flush_latency_max, waited)
+
+    def as_dict(self) -> Dict[str, Any]:
+        end = self.finished or time.time()
+        return {
+            "stream_id": self.stream_id,
+            "active": self.finished is None,
+            "duration_ms": round((end - self.started) * 1000, 1),
+            "events": self.events,
+            "tokens": self.tokens,
+            "frames": self.frames,
+            "chunk_frames": self.flushes,
+            "bytes": self.bytes,
+            "keepalives": self.keepalives,
+            "cancelled": self.cancelled,
+            "tokens_per_frame": round(self.tokens / self.flushes, 2) if self.flushes else 0,
+            "flush_latency_avg_ms": round(self.flush_latency_total / self.flushes * 1000, 2) if self.flushes else 0,
+            "flush_latency_max_ms": round(self.flush_latency_max * 1000, 2),
+        }
+
+
+class StreamRegistry:
+    """Active streams plus the most recently finished ones."""
+
+    def __init__(self, keep: int = RECENT_STREAMS):
+        self.keep = keep
+        self._lock = threading.Lock()
+        self._streams: "OrderedDict[str, StreamStats]" = OrderedDict()
+        # Lifetime totals (the per-stream list only keeps recent streams)
+        self.total_streams = 0
+        self.total_cancelled = 0
+
+    def open(self, stream_id: str) -> StreamStats:
+        stats = StreamStats(stream_id)
+        with self._lock:
+            self._streams[stream_id] = stats
+            self.total_streams += 1
+            finished = [k for k, s in self._streams.items() if s.finished is not None]
+            for key in finished[:max(0, len(finished) - self.keep)]:
+                del self._streams[key]
+        return stats
+
+    def close(self, stats: StreamStats):
+        stats.finished = time.time()
+        if stats.cancelled:
+            with self._lock:
+                self.total_cancelled += 1
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            streams = [s.as_dict() for s in self._streams.values()]
+        chunk_frames = sum(s["chunk_frames"] for s in streams)
+        return {
+            "encoder": "orjson" if orjson is not None else "json",
+            "flush_interval_ms": settings.stream_flush_interval_ms,
+            "flush_max_chars": settings.stream_flush_max_chars,
+            "keepalive_seconds": settings.stream_keepalive_seconds,
+            "active": sum(1 for s in streams if s["active"]),
+            "total_streams": self.total_streams,
+            "cancelled": self.total_cancelled,
+            "frames": sum(s["frames"] for s in streams),
+            "bytes": sum(s["bytes"] for s in streams),
+            "tokens_per_frame": round(sum(s["tokens"] for s in streams) / chunk_frames, 2) if chunk_frames else 0,
+            "streams": streams,
+        }
+
+
+def _report_upstream_failure(task: asyncio.Future):
+    if not task.cancelled() and task.exception() is not None:
+        print(f"⚠️  Chat stream cleanup failed after disconnect: {task.exception()}")
+
+
+async def sse_frames(
+    events: AsyncIterator[Dict[str, Any]],
+    stats: StreamStats,
+    flush_interval_ms: int = None,
+    flush_max_chars: int = None,
+    keepalive_seconds: float = None
+) -> AsyncIterator[bytes]:
+    """
+    Turn an event stream into SSE frames.
+
+    `chunk` events are buffered and sent as one frame once the oldest
+    buffered token is `flush_interval_ms` old or the text reaches
+    `flush_max_chars` (the first token is sent immediately); any other
+    event flushes the buffer first so event order is preserved. A
+    keep-alive comment goes out after `keepalive_seconds` without a frame.
+
+    When the server cancels or closes this generator (the client went
+    away) the pending read of `events` is cancelled, which cancels whatever
+    upstream work it is waiting on, and awaited for up to
+    `CANCEL_GRACE_SECONDS` so that work can finish cleaning up.
+    """
+    interval = (settings.stream_flush_interval_ms if flush_interval_ms is None else flush_interval_ms) / 1000
+    max_chars = settings.stream_flush_max_chars if flush_max_chars is None else flush_max_chars
+    keepalive = settings.stream_keepalive_seconds if keepalive_seconds is None else keepalive_seconds
+
+    buffer: List[str] = []
+    buffered_chars = 0
+    buffered_since = 0.0
+    last_frame = time.monotonic()
+
+    def flush() -> bytes:
+        nonlocal buffered_chars, last_frame
+        frame = encode_event({"type": "chunk", "content": "".join(buffer)})
+        stats.flushed(time.monotonic() - buffered_since)
+        stats.frame(frame)
+        buffer.clear()
+        buffered_chars = 0
+        last_frame = time.monotonic()
+        return frame
+
+    iterator = events.__aiter__()
+    pending = None
+    try:
+        while True:
+            if pending is None:
+                pending = asyncio.ensure_future(iterator.__anext__())
+
+            # Wake up for whichever comes first: the buffer's flush deadline or keep-alive
+            now = time.monotonic()
+            deadlines = []
+            if buffer:
+                deadlines.append(buffered_since + interval - now)
+            if keepalive > 0:
+                deadlines.append(last_frame + keepalive - now)
+            timeout = max(0.0, min(deadlines)) if deadlines else None
+
+            done, _ = await asyncio.wait({pending}, timeout=timeout)
+            if not done:
+                if buffer and time.monotonic() - buffered_since >= interval:
+                    yield flush()
+                elif keepalive > 0 and time.monotonic() - last_frame >= keepalive:
+                    stats.keepalives += 1
+                    stats.frame(KEEPALIVE_FRAME)
+                    last_frame = time.monotonic()
+                    yield KEEPALIVE_FRAME
+                continue
+
+            try:
+                event = pending.result()
+            except StopAsyncIteration:
+                break
+            finally:
+                pending = None
+            stats.events += 1
+
+            if event.get("type") == "chunk":
+                stats.tokens += 1
+                if not buffer:
+                    buffered_since = time.monotonic()
+                buffer.append(event["content"])
+                buffered_chars += len(event["content"])
+                # The first token goes out at once so time-to-first-token isn't delayed
+                if buffered_chars >= max_chars or interval <= 0 or stats.tokens == 1:
+                    yield flush()
+                continue
+
+            if buffer:
+                yield flush()
+            frame = encode_event(event)
+            stats.frame(frame)
+            last_frame = time.monotonic()
+            yield frame
+
+        if buffer:
+            yield flush()
+    finally:
+        # Cancelled or closed from outside: the server noticed a disconnect
+        if pending is not None and not pending.done():
+            stats.cancelled = True
+            pending.add_done_callback(_report_upstream_failure)
+            pending.cancel()
+            # Let the upstream generator unwind (and persist what it has).
+            # Shielded: Starlette's cancel scope keeps cancelling this task
+            with anyio.CancelScope(shield=True):
+                await asyncio.wait({pending}, timeout=CANCEL_GRACE_SECONDS)
+
+
+# Singleton instance
+stream_registry = StreamRegistry()
@@ -0,0 +1,41 @@
+"""
+Stage Timings for ChatPDF
+Records when each stage of a chat request starts and ends, relative to the
+request's arrival, so time-to-first-token can be broken down by stage even
+when stages overlap.
+"""
+from contextlib import contextmanager
+from typing import Any, Dict, Optional
+import time
+
+
+class StageTimings:
+    """Start/end offsets in milliseconds per named stage, plus point-in-time marks."""
+
+    def __init__(self):
+        self._origin = time.perf_counter()
+        self._stages: Dict[str, Dict[str, Optional[float]]] = {}
+        self._marks: Dict[str, float] = {}
+
+    def _now_ms(self) -> float:
+        return round((time.perf_counter() - self._origin) * 1000, 1)
+
+    @contextmanager
+    def stage(self, name: str):
+        """Time a block; works around `await`s since it only reads the clock."""
+        self._stages[name] = {"start_ms": self._now_ms(), "end_ms": None}
+        try:
+            yield
+        finally:
+            self._stages[name]["end_ms"] = self._now_ms()
+
+    def mark(self, name: str):
+        """Record a single moment (e.g. the first streamed token), once."""
+        self._marks.setdefault(name, self._now_ms())
+
+    def as_dict(self) -> Dict[str, Any]:
+        return {
+            "stages": {name: dict(span) for name, span in self._stages.items()},
+            **{f"{name}_ms": value for name, value in self._marks.items()},
+            "total_ms": self._now_ms()
+        }
@@ -1,6 +1,10 @@
 """
 vector_store.py
 Embedded mode - no external server required
+
+Defines the ChromaDB backend and the backend factory. The backend used
+by the app is chosen with `settings.vector_backend` ("chroma" or "numpy");
+the collection served is chosen by the versioned collection registry.
 """
 # Fix for ChromaDB + Railway (requires SQLite > 3.35)
 import sys
@@ -10,68 +14,77 @@ try:
 except ImportError:
     pass
 
-import chromadb
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Iterator, Set
 from pathlib import Path
+import re
 
 from ..config import settings
-from ..services.embeddings import embedding_service
+from ..services.embeddings import embedding_service, FULL_DIMENSIONS, DEFAULT_EMBEDDING_MODEL
+from ..services.base_vector_store import BaseVectorStore
+from ..services.partition_cache import PartitionCache, exact_search
+from ..services.collection_manager import VersionedVectorStore
 
 # Define a custom embedding function for Chroma that uses our Gemini service
 # This prevents Chroma from trying to load sentence-transformers (which we removed)
 class GeminiEmbeddingFunction:
     def __call__(self, input: List[str]) -> List[List[float]]:
         return embedding_service.embed_chunks(input)
-        
+
     def name(self) -> str:
         return "gemini_embedding_001"
 
-class VectorStore:
-    def __init__(self):
+
+class ChromaVectorStore(BaseVectorStore):
+    backend_name = "chroma"
+
+    def __init__(self, name: str = "document_chunks", dimensions: int = None):
+        import chromadb
+
+        self.dimensions = dimensions or settings.embedding_dimensions
+        collection_metadata = {"hnsw:space": "cosine", "embedding_dimensions": self.dimensions}
+
         # Ensure persist directory exists
         persist_path = Path(settings.chroma_persist_dir)
         persist_path.mkdir(parents=True, exist_ok=True)
-        
+
         # Initialize persistent client
         self.client = chromadb.PersistentClient(path=str(persist_path))
-        
+
         # Use our custom embedding function
         try:
             self.collection = self.client.get_or_create_collection(
-                name="document_chunks",
-                metadata={"hnsw:space": "cosine"},
+                name=name,
+                metadata=collection_metadata,
                 embedding_function=GeminiEmbeddingFunction()
             )
         except ValueError as e:
-            # Handle migration from default/old embedding function to new key
+            # Collections created with another embedding function are opened
+            # as-is: vectors are always supplied explicitly, so the stored
+            # function is never invoked and existing chunks stay searchable
             if "Embedding function conflict" in str(e):
-                print("⚠️  Embedding function changed (Migration to Gemini). Resetting collection...")
-                self.client.delete_collection("document_chunks")
-                # Recreate with new function
-                self.collection = self.client.create_collection(
-                    name="document_chunks",
-                    metadata={"hnsw:space": "cosine"},
-                    embedding_function=GeminiEmbeddingFunction()
-                )
+                print(f"ℹ️  Collection {name} was created with a different embedding function; opening it unchanged")
+                self.collection = self.client.get_collection(name=name)
             else:
                 raise e
 
+        # Per-document partitions for exact search on document-filtered queries
+        self.partitions = PartitionCache(
+            self.get_document_chunks,
+            max_bytes=settings.partition_cache_mb * 1024 * 1024
+        )
 
-    def add_chunks(
-        self, 
-        doc_id: str, 
-        chunks: List[str], 
-        embeddings: List[List[float]], 
-        metadatas: List[Dict[str, Any]]
-    ):
-        """Add document chunks to the vector store."""
-        # Generate unique IDs for each chunk
-        ids = [f"{doc_id}_{i}" for i in range(len(chunks))]
-        
-        # Add document_id to each metadata
-        for meta in metadatas:
-            meta["document_id"] = doc_id
-        
+    def _invalidate(self, doc_id: str):
+        super()._invalidate(doc_id)
+        self.partitions.invalidate(doc_id)
+
+    def _document_count(self, doc_id: str) -> int:
+        count = self.partitions.get_count(doc_id)
+        if count is None:
+            count = len(self.collection.get(where={"document_id": doc_id}, include=[])["ids"])
+            self.partitions.set_count(doc_id, count)
+        return count
+
+    def _upsert(self, ids, chunks, embeddings, metadatas):
         self.collection.upsert(
             ids=ids,
             embeddings=embeddings,
@@ -80,47 +93,147 @@ class VectorStore:
         )
 
     def query(
-        self, 
-        query_embedding: List[float], 
-        n_results: int = 5, 
+        self,
+        query_embedding: List[float],
+        n_results: int = 5,
         doc_ids: List[str] = None
     ) -> Dict[str, Any]:
-        """Query the vector store for similar chunks."""
+        """
+        Query the vector store for similar chunks.
+        Small document-filtered searches are answered exactly from per-document
+        partitions; large or unfiltered searches use the HNSW index.
+        """
+        limit = settings.exact_search_max_chunks
+        if doc_ids and limit > 0:
+            doc_ids = list(dict.fromkeys(doc_ids))
+            if sum(self._document_count(d) for d in doc_ids) <= limit:
+                return exact_search([self.partitions.get(d) for d in doc_ids], query_embedding, n_results)
+
         where_filter = None
         if doc_ids:
             where_filter = {"document_id": {"$in": doc_ids}}
-        
+
         results = self.collection.query(
             query_embeddings=[query_embedding],
             n_results=n_results,
             where=where_filter,
-            include=["documents", "metadatas"]
+            include=["documents", "metadatas", "distances"]
         )
-        
+
         # Format results to match expected interface
         return {
+            "ids": results.get("ids", [[]]),
             "documents": results.get("documents", [[]]),
-            "metadatas": results.get("metadatas", [[]])
+            "metadatas": results.get("metadatas", [[]]),
+            "distances": results.get("distances", [[]])
         }
 
-    def delete_document(self, doc_id: str):
-        """Remove all chunks associated with a document."""
+    def _delete_document(self, doc_id: str):
         # Get all chunks for this document
         results = self.collection.get(
             where={"document_id": doc_id},
             include=[]
         )
-        
+
         if results["ids"]:
             self.collection.delete(ids=results["ids"])
 
+    def get_chunks(self, ids: List[str]) -> Dict[str, List[Any]]:
+        if not ids:
+            return {"ids": [], "documents": [], "metadatas": []}
+        results = self.collection.get(ids=ids, include=["documents", "metadatas"])
+        return {
+            "ids": results["ids"],
+            "documents": results["documents"],
+            "metadatas": results["metadatas"]
+        }
+
+    def get_document_chunks(self, doc_id: str) -> Dict[str, List[Any]]:
+        results = self.collection.get(
+            where={"document_id": doc_id},
+            include=["embeddings", "documents", "metadatas"]
+        )
+        return {
+            "ids": results["ids"],
+            "documents": results["documents"],
+            "embeddings": results["embeddings"],
+            "metadatas": results["metadatas"]
+        }
+
+    def iter_chunks(self, batch_size: int = 500) -> Iterator[Dict[str, List[Any]]]:
+        offset = 0
+        while True:
+            results = self.collection.get(
+                limit=batch_size,
+                offset=offset,
+                include=["embeddings", "documents", "metadatas"]
+            )
+            if not results["ids"]:
+                return
+            yield {
+                "ids": results["ids"],
+                "documents": results["documents"],
+                "embeddings": results["embeddings"],
+                "metadatas": results["metadatas"]
+            }
+            offset += len(results["ids"])
+
+    def list_ids(self) -> Set[str]:
+        ids = set()
+        offset = 0
+        while True:
+            results = self.collection.get(limit=5000, offset=offset, include=[])
+            if not results["ids"]:
+                return ids
+            ids.update(results["ids"])
+            offset += len(results["ids"])
+
+    def drop(self):
+        self.client.delete_collection(self.collection.name)
+
     def get_collection_stats(self) -> Dict[str, Any]:
         """Get collection statistics for health checks."""
         return {
             "name": self.collection.name,
-            "count": self.collection.count()
+            "count": self.collection.count(),
+            "backend": self.backend_name,
+            # Collections created before dimensions were configurable are full size
+            "dimensions": (self.collection.metadata or {}).get("embedding_dimensions", FULL_DIMENSIONS),
+            "path": settings.chroma_persist_dir,
+            "partitions": self.partitions.stats()
         }
 
 
-# Singleton instance
-vector_store = VectorStore()
+# Backwards-compatible name for the default backend
+VectorStore = ChromaVectorStore
+
+
+def collection_name_for(dimensions: int, model: str = None) -> str:
+    """
+    Collections are named per embedding profile (model + output size) so a
+    reindex or re-embedding never overwrites the live one.
+    """
+    name = "document_chunks"
+    if model and model != DEFAULT_EMBEDDING_MODEL:
+        name += "_" + re.sub(r"[^a-z0-9]+", "-", model.split("/")[-1].lower()).strip("-")
+    if dimensions != FULL_DIMENSIONS:
+        name += f"_d{dimensions}"
+    return name
+
+
+def create_vector_store(backend: str = None, dimensions: int = None, model: str = None) -> BaseVectorStore:
+    """Instantiate the configured vector store backend for an embedding profile."""
+    backend = (backend or settings.vector_backend).lower()
+    dimensions = dimensions or settings.embedding_dimensions
+    name = collection_name_for(dimensions, model)
+    if backend == "chroma":
+        return ChromaVectorStore(name=name, dimensions=dimensions)
+    if backend == "numpy":
+        from .numpy_vector_store import NumpyVectorStore
+        return NumpyVectorStore(name=name)
+    raise ValueError(f"Unknown vector backend: {backend}")
+
+
+# Singleton instance: serves the active collection version and rebuilds a
+# replacement in the background when the embedding profile changes
+vector_store = VersionedVectorStore(create_vector_store)
@@ -9,6 +9,9 @@ import { cn } from '@/lib/utils';
 import { chat as chatApi, getConversationMessages, listConversations } from '@/lib/api';
 import { useToastStore } from '@/store/useToastStore';
 
+// Delay before reloading a new conversation's title if it wasn't ready when the answer ended
+const TITLE_REFRESH_MS = 3000;
+
 export const ChatInterface = () => {
   const { 
     messages, 
@@ -24,6 +27,7 @@ export const ChatInterface = () => {
     currentConversationId,
     setCurrentConversationId,
     setConversations,
+    updateConversationTitle,
     documents
   } = useChatStore();
   
@@ -105,13 +109,17 @@ export const ChatInterface = () => {
       const decoder = new TextDecoder();
       
       let fullContent = '';
+      let titleReceived = false;
+      // Frames can span reads: carry an incomplete last line over to the next read
+      let pending = '';
       
       while (true) {
         const { done, value } = await reader?.read() || { done: true, value: undefined };
         if (done) break;
         
-        const chunk = decoder.decode(value);
+        const chunk = pending + decoder.decode(value, { stream: true });
         const lines = chunk.split('\n');
+        pending = lines.pop() ?? '';
         
         for (const line of lines) {
           if (line.startsWith('data: ')) {
@@ -121,10 +129,14 @@ export const ChatInterface = () => {
               if (data.type === 'start') {
                 if (data.conversation_id && !currentConversationId) {
                   setCurrentConversationId(data.conversation_id);
-                  // Refresh conversation list to get the new title
+                  // Refresh conversation list to show the new conversation
                   const convs = await listConversations();
                   setConversations(convs);
                 }
+              } else if (data.type === 'title') {
+                // Generated title, when it is ready before the answer ends
+                titleReceived = true;
+                updateConversationTitle(data.conversation_id, data.title);
               } else if (data.type === 'chunk') {
                 fullContent += data.content;
                 setStreamingContent(fullContent);
@@ -141,6 +153,8 @@ export const ChatInterface = () => {
                 addMessage(assistantMessage);
                 setStreamingContent('');
                 setStreamingCitations([]);
+                // The answer is complete: re-enable input without waiting for the body to close
+                setIsStreaming(false);
               } else if (data.type === 'error') {
                 addToast(data.content, 'error');
               }
@@ -151,6 +165,17 @@ export const ChatInterface = () => {
         }
       }
 
+      if (!currentConversationId && !titleReceived) {
+        // The title is still being generated; it is saved server-side, so reload it shortly
+        setTimeout(async () => {
+          try {
+            setConversations(await listConversations());
+          } catch (e) {
+            // keep the placeholder title
+          }
+        }, TITLE_REFRESH_MS);
+      }
+
     } catch (err: any) {
       console.error('Chat error', err);
       addToast(err.message || 'Connection failed', 'error');
@@ -280,6 +305,8 @@ export const ChatInterface = () => {
                     id: 'streaming',
                     role: 'assistant',
                     content: streamingContent,
+                    // Citations arrive while the answer is still streaming
+                    citations: streamingCitations,
                     created_at: new Date().toISOString()
                   }}
                   isStreaming={true}
@@ -362,6 +389,10 @@ const ChatMessage = ({ message, isStreaming }: { message: Message, isStreaming?:
           <div className="prose prose-sm dark:prose-invert max-w-none break-words whitespace-pre-wrap text-[14px] leading-7 tracking-wide font-normal">
             {message.content || (isStreaming ? <span className="inline-block h-4 w-1.5 animate-pulse bg-primary" /> : null)}
           </div>
+
+          {isAssistant && message.truncated && (
+            <p className="text-[11px] italic text-muted-foreground">Answer interrupted before it finished.</p>
+          )}
           
           {isAssistant && message.citations && message.citations.length > 0 && (
             <div className="flex flex-wrap gap-2 pt-4 mt-2 border-t border-border/40">
@@ -414,8 +445,13 @@ const CitationItem = ({ citation, index }: { citation: any, index: number }) =>
               <span className="text-[10px] font-extrabold uppercase tracking-widest text-primary truncate max-w-[150px]">
                 {citation.filename}
               </span>
-              <span className="bg-secondary px-2 py-0.5 rounded text-[9px] font-bold text-muted-foreground border border-border/50">PAGE {citation.page}</span>
+              <span className="bg-secondary px-2 py-0.5 rounded text-[9px] font-bold text-muted-foreground border border-border/50">
+                {citation.section_title ? `SECTION ${citation.page}` : `PAGE ${citation.page}`}
+              </span>
             </div>
+            {citation.section_title && (
+              <p className="mb-2 text-[11px] font-semibold text-foreground truncate">{citation.section_title}</p>
+            )}
             <div className="relative">
                <Quote size={12} className="absolute -top-1 -left-1 text-primary/20 rotate-180" />
                <p className="pl-4 text-[12px] leading-relaxed text-muted-foreground italic line-clamp-6 font-serif">
@@ -14,6 +14,7 @@ export interface Citation {
   filename: string;
   page: number;
   chunk_text: string;
+  section_title?: string;
 }
 
 export interface Message {
@@ -21,6 +22,7 @@ export interface Message {
   role: 'user' | 'assistant';
   content: string;
   citations?: Citation[];
+  truncated?: boolean;
   created_at: string;
 }
 
@@ -52,6 +54,7 @@ interface ChatState {
   setConversations: (convs: Conversation[]) => void;
   addConversation: (conv: Conversation) => void;
   removeConversation: (id: string) => void;
+  updateConversationTitle: (id: string, title: string) => void;
   setLoadingConversations: (loading: boolean) => void;
   
   setMessages: (messages: Message[]) => void;
@@ -95,6 +98,9 @@ export const useChatStore = create<ChatState>((set) => ({
     currentConversationId: state.currentConversationId === id ? null : state.currentConversationId,
     messages: state.currentConversationId === id ? [] : state.messages
   })),
+  updateConversationTitle: (id, title) => set((state) => ({
+    conversations: state.conversations.map((c) => c.id === id ? { ...c, title } : c)
+  })),
   setLoadingConversations: (isLoadingConversations) => set({ isLoadingConversations }),
 
   setMessages: (messages) => set({ messages }),